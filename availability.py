@@ -0,0 +1,97 @@
+# availability.py
+# In-memory index of booked slots so booking taps and roster queries are answered without parsing workbooks.
+import threading
+from datetime import timedelta
+
+from records import Shift, parse_booking_row
+
+
+class BookingIndex:
+    """
+    Bookings per date and shift (the roster) and per student, covering the current week onwards.
+    The index is rebuilt from the store's hot partitions whenever it has been written to
+    by something other than apply_bookings() / apply_cancellation(), or when the week rolls over.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self.version = None
+        self.start = None
+        self.slots = {}       # day ordinal -> [list of Booking per Shift]
+        self.by_student = {}  # str(student_id) -> list of Booking
+
+    def _rebuild(self, start):
+        slots = {}
+        by_student = {}
+        for row in self.store.read_rows("bookings", start=start):
+            booking = parse_booking_row(row)
+            if booking is None:
+                continue
+            slots.setdefault(booking.ordinal, [[] for _ in Shift])[booking.shift].append(booking)
+            by_student.setdefault(booking.student_id, []).append(booking)
+        self.slots = slots
+        self.by_student = by_student
+        self.start = start
+
+    def refresh(self, today):
+        """Make sure the index reflects storage; cheap when nothing changed."""
+        start = today - timedelta(days=today.weekday())
+        with self._lock:
+            version = self.store.data_version("bookings")
+            if self.version != version or self.start != start:
+                self._rebuild(start)
+                self.version = version
+        return self
+
+    def count(self, day, shift):
+        day_slots = self.slots.get(day.toordinal())
+        return len(day_slots[Shift.parse(shift)]) if day_slots else 0
+
+    def roster(self, day, shift):
+        """Bookings of one slot, in booking order."""
+        with self._lock:
+            day_slots = self.slots.get(day.toordinal())
+            return list(day_slots[Shift.parse(shift)]) if day_slots else []
+
+    def user_bookings(self, student_id):
+        with self._lock:
+            return list(self.by_student.get(str(student_id), []))
+
+    def apply_booking(self, booking, version_before):
+        """
+        Record a booking we just wrote. If anything else touched storage in between,
+        fall back to a rebuild on the next refresh.
+        """
+        self.apply_bookings([booking], version_before)
+
+    def apply_bookings(self, bookings, version_before):
+        """Record bookings written together by one append_rows() call."""
+        with self._lock:
+            if self.version == version_before and self.store.data_version("bookings") == version_before + 1:
+                for booking in bookings:
+                    self.slots.setdefault(booking.ordinal, [[] for _ in Shift])[booking.shift].append(booking)
+                    self.by_student.setdefault(booking.student_id, []).append(booking)
+                self.version = version_before + 1
+            else:
+                self.version = None
+
+    def apply_cancellation(self, booking, version_before):
+        """Drop a booking we just deleted from storage (same fallback as apply_bookings)."""
+        with self._lock:
+            if self.version == version_before and self.store.data_version("bookings") == version_before + 1:
+                key = (booking.ordinal, booking.shift, booking.student_id)
+                day_slots = self.slots.get(booking.ordinal)
+                if day_slots:
+                    _remove_first(day_slots[booking.shift], key)
+                _remove_first(self.by_student.get(booking.student_id, []), key)
+                self.version = version_before + 1
+            else:
+                self.version = None
+
+
+def _remove_first(bookings, key):
+    for i, b in enumerate(bookings):
+        if (b.ordinal, b.shift, b.student_id) == key:
+            del bookings[i]
+            return
@@ -0,0 +1,244 @@
+# conversation.py
+# Pending dialog steps per chat, with TTL eviction, a size cap and optional persistence.
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Seconds a JSON backend batches changes before rewriting its file
+JSON_SAVE_DELAY = 1.0
+
+
+class JsonFileBackend:
+    """
+    Keeps every pending step in one JSON file, rewritten atomically. Changes only touch an
+    in-memory copy; the file is written at most once per `delay` seconds from a timer thread
+    (immediately when delay is 0), so a burst of logins or a purge costs one write.
+    flush() writes outstanding changes now, e.g. at exit.
+    """
+
+    def __init__(self, path, delay=JSON_SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self._data = {}
+        self._dirty = False
+        self._timer = None
+        self._lock = threading.Lock()        # guards _data, _dirty and _timer
+        self._write_lock = threading.Lock()  # one writer at a time, snapshots written in order
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            raw = json.load(f)
+        with self._lock:
+            self._data = {int(k): tuple(v) for k, v in raw.items()}
+            return dict(self._data)
+
+    def put(self, chat_id, entry):
+        with self._lock:
+            self._data[chat_id] = entry
+            self._changed()
+        self._maybe_flush()
+
+    def delete_many(self, chat_ids):
+        with self._lock:
+            for chat_id in chat_ids:
+                self._data.pop(chat_id, None)
+            self._changed()
+        self._maybe_flush()
+
+    def _changed(self):
+        """Needs _lock."""
+        self._dirty = True
+        if self.delay > 0 and self._timer is None:
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _maybe_flush(self):
+        if self.delay <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                snapshot = dict(self._data)
+            try:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({str(k): list(v) for k, v in snapshot.items()}, f)
+                os.replace(tmp, self.path)
+            except Exception:
+                logger.exception("Saving %s failed", self.path)
+                with self._lock:
+                    self._changed()
+
+
+class SqliteBackend:
+    """One row per chat; only the changed row is written."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "chat_id INTEGER PRIMARY KEY, expires_at REAL, step TEXT, data TEXT)"
+        )
+        self.conn.commit()
+
+    def load(self):
+        rows = self.conn.execute("SELECT chat_id, expires_at, step, data FROM conversations ORDER BY expires_at")
+        return {chat_id: (expires_at, step, json.loads(data)) for chat_id, expires_at, step, data in rows}
+
+    def put(self, chat_id, entry):
+        expires_at, step, data = entry
+        self.conn.execute(
+            "INSERT OR REPLACE INTO conversations (chat_id, expires_at, step, data) VALUES (?, ?, ?, ?)",
+            (chat_id, expires_at, step, json.dumps(data)),
+        )
+        self.conn.commit()
+
+    def delete_many(self, chat_ids):
+        self.conn.executemany("DELETE FROM conversations WHERE chat_id = ?", [(cid,) for cid in chat_ids])
+        self.conn.commit()
+
+    def flush(self):
+        pass
+
+
+def make_backend(path):
+    """SQLite for *.db / *.sqlite paths, a JSON file otherwise, nothing when path is empty."""
+    if not path:
+        return None
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteBackend(path)
+    return JsonFileBackend(path)
+
+
+class ConversationStore:
+    """
+    Maps chat_id -> (step name, data dict).
+    Entries expire ttl seconds after they were last set; when more than max_entries
+    dialogs are pending the least recently updated one is dropped.
+    Data must be JSON-serialisable so it can be persisted.
+    """
+
+    def __init__(self, ttl=900, max_entries=5000, backend=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if backend is not None:
+            now = time.time()
+            expired = []
+            for chat_id, entry in sorted(backend.load().items(), key=lambda kv: kv[1][0]):
+                if entry[0] > now:
+                    self._entries[chat_id] = tuple(entry)
+                else:
+                    expired.append(chat_id)
+            if expired:
+                backend.delete_many(expired)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set(self, chat_id, step, **data):
+        entry = (time.time() + self.ttl, step, data)
+        with self._lock:
+            self._entries.pop(chat_id, None)
+            self._entries[chat_id] = entry
+            dropped = []
+            while len(self._entries) > self.max_entries:
+                dropped.append(self._entries.popitem(last=False)[0])
+            if self.backend is not None:
+                if dropped:
+                    self.backend.delete_many(dropped)
+                self.backend.put(chat_id, entry)
+
+    def get(self, chat_id):
+        """(step, data) for a live dialog, or None."""
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._remove(chat_id)
+                return None
+            return entry[1], entry[2]
+
+    def pop(self, chat_id):
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                return None
+            self._remove(chat_id)
+            return None if entry[0] <= time.time() else (entry[1], entry[2])
+
+    def live(self):
+        """[(chat_id, step, data)] of every dialog that has not expired."""
+        now = time.time()
+        with self._lock:
+            return [(cid, entry[1], entry[2]) for cid, entry in self._entries.items() if entry[0] > now]
+
+    def purge(self):
+        """Drop expired dialogs; returns how many were removed."""
+        now = time.time()
+        with self._lock:
+            expired = [cid for cid, entry in self._entries.items() if entry[0] <= now]
+            for cid in expired:
+                del self._entries[cid]
+            if expired and self.backend is not None:
+                self.backend.delete_many(expired)
+        return len(expired)
+
+    def flush(self):
+        """Write out changes a backend is still batching."""
+        if self.backend is not None:
+            self.backend.flush()
+
+    def _remove(self, chat_id):
+        del self._entries[chat_id]
+        if self.backend is not None:
+            self.backend.delete_many([chat_id])
+
+
+class SessionStore:
+    """
+    Logged-in users: user id -> session dict, kept in a ConversationStore so that with a backend
+    sessions survive a restart and an open /reserve picker still knows who is tapping.
+    Sessions expire ttl seconds after login.
+    """
+
+    STEP = "session"
+
+    def __init__(self, ttl=30 * 24 * 3600, max_entries=50000, backend=None):
+        self._store = ConversationStore(ttl=ttl, max_entries=max_entries, backend=backend)
+
+    def __contains__(self, user_id):
+        return self._store.get(user_id) is not None
+
+    def __setitem__(self, user_id, session):
+        self._store.set(user_id, self.STEP, **session)
+
+    def get(self, user_id, default=None):
+        entry = self._store.get(user_id)
+        return entry[1] if entry is not None else default
+
+    def items(self):
+        return [(user_id, session) for user_id, _, session in self._store.live()]
+
+    def purge(self):
+        return self._store.purge()
+
+    def flush(self):
+        self._store.flush()
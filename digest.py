@@ -0,0 +1,75 @@
+# digest.py
+# Coalesces group notifications into one message per chat per time window.
+import threading
+from datetime import datetime
+
+from utils import SG_TZ
+
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+
+class DigestNotifier:
+    """
+    Buffers notifications per chat and sends them as a single digest once the window elapses.
+    A window of 0 disables batching and every message is sent straight away.
+    Urgent messages always bypass the buffer.
+    """
+
+    def __init__(self, send, window=0):
+        self.send = send
+        self.window = window
+        self._pending = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def notify(self, chat_id, msg, urgent=False):
+        if urgent or self.window <= 0:
+            self.send(chat_id, msg)
+            return
+        with self._lock:
+            self._pending.setdefault(chat_id, []).append((datetime.now(SG_TZ), msg))
+            if chat_id not in self._timers:
+                timer = threading.Timer(self.window, self.flush, args=(chat_id,))
+                timer.daemon = True
+                self._timers[chat_id] = timer
+                timer.start()
+
+    def pending_count(self):
+        with self._lock:
+            return sum(len(v) for v in self._pending.values())
+
+    def flush(self, chat_id=None):
+        """Send buffered messages for one chat, or for every chat when chat_id is None."""
+        with self._lock:
+            chat_ids = list(self._pending) if chat_id is None else [chat_id]
+            batches = {}
+            for cid in chat_ids:
+                batches[cid] = self._pending.pop(cid, [])
+                timer = self._timers.pop(cid, None)
+                if timer is not None and timer is not threading.current_thread():
+                    timer.cancel()
+        for cid, events in batches.items():
+            for text in format_digest(events):
+                self.send(cid, text)
+
+
+def format_digest(events):
+    """Render buffered (time, msg) pairs as one or more digest messages under the size limit."""
+    if not events:
+        return []
+    if len(events) == 1:
+        return [events[0][1]]
+
+    first, last = events[0][0], events[-1][0]
+    header = f"Digest: {len(events)} updates ({first.strftime('%H:%M')}–{last.strftime('%H:%M')})"
+    out = []
+    current = header
+    for _, msg in events:
+        line = f"\n• {msg}"
+        if len(current) + len(line) > MAX_MESSAGE_LENGTH:
+            out.append(current)
+            current = header + " (cont.)"
+        current += line
+    out.append(current)
+    return out
@@ -0,0 +1,188 @@
+# dispatch.py
+# Per-chat ordered update processing: each chat's updates run one at a time and in order,
+# different chats run in parallel on a fixed pool of workers.
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Queue waits kept for the percentiles in stats()
+WAIT_SAMPLES = 1000
+
+
+def chat_key(update):
+    """Chat an update belongs to; updates without a chat fall back to the sender, then to the update id."""
+    for attr in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = getattr(update, attr, None)
+        if message is not None:
+            return message.chat.id
+    call = getattr(update, "callback_query", None)
+    if call is not None:
+        if call.message is not None:
+            return call.message.chat.id
+        return call.from_user.id
+    for attr in ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query", "poll_answer"):
+        event = getattr(update, attr, None)
+        user = getattr(event, "from_user", None) or getattr(event, "user", None)
+        if user is not None:
+            return user.id
+    return ("update", update.update_id)
+
+
+class ChatDispatcher:
+    """
+    Hashes chats onto `workers` threads (started on first use). A chat always lands on the same
+    worker and runs one update at a time, so its updates never overtake each other and the
+    /start and /cancel dialogs see their steps in order. Chats sharing a worker take turns.
+
+    A handler that hands a chat's work to another thread (the rush admission queue) calls hold():
+    the chat is parked, without blocking the worker, until the returned resume(followup) is called;
+    followup then runs on the chat's worker before any later update of that chat.
+
+    At most `max_per_chat` updates of one chat wait at a time; further ones are dropped and
+    on_overflow(chat, update) is called once until the chat's queue drains.
+    process(updates) handles a list of updates, e.g. TeleBot.process_new_updates on a bot
+    created with threaded=False so handlers run on the worker itself.
+    """
+
+    def __init__(self, process, workers=4, max_per_chat=20, on_overflow=None):
+        self._process = process
+        self.workers = workers
+        self.max_per_chat = max_per_chat
+        self._on_overflow = on_overflow
+        self._queues = [queue.Queue() for _ in range(workers)]  # chats with work, per worker
+        self._threads = [None] * workers
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = {}         # chat -> deque of (update or followup, queued at)
+        self._scheduled = set()    # chats sitting in a worker queue
+        self._running = {}         # chat -> started at
+        self._held = set()         # chats parked by hold()
+        self._overflowing = set()  # chats that hit max_per_chat since their queue last drained
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _start_workers(self):
+        for i, thread in enumerate(self._threads):
+            if thread is None or not thread.is_alive():
+                self._threads[i] = threading.Thread(target=self._run, args=(self._queues[i],), daemon=True,
+                                                    name=f"UpdateWorker-{i}")
+                self._threads[i].start()
+
+    def _depth(self, chat):
+        return len(self._pending.get(chat, ())) + (chat in self._running)
+
+    def _schedule(self, chat):
+        """Hand the chat to its worker if it has work and is neither queued, running nor held. Needs _lock."""
+        if self._pending.get(chat) and chat not in self._scheduled and chat not in self._running \
+                and chat not in self._held:
+            self._scheduled.add(chat)
+            self._queues[hash(chat) % self.workers].put(chat)
+
+    def submit(self, updates):
+        """Queue updates by chat; returns immediately."""
+        overflowed = []
+        with self._lock:
+            self._start_workers()
+            for update in updates:
+                chat = chat_key(update)
+                if self._depth(chat) >= self.max_per_chat:
+                    self.dropped += 1
+                    if chat not in self._overflowing:
+                        self._overflowing.add(chat)
+                        overflowed.append((chat, update))
+                    continue
+                self._pending.setdefault(chat, deque()).append((update, time.monotonic()))
+                self._schedule(chat)
+        for chat, update in overflowed:
+            logger.warning("Update queue of chat %s is full, dropping updates", chat)
+            if self._on_overflow is not None:
+                try:
+                    self._on_overflow(chat, update)
+                except Exception:
+                    logger.exception("Overflow notice to chat %s failed", chat)
+
+    def hold(self):
+        """
+        Park the chat whose update this worker is handling; returns resume(followup=None), callable
+        from any thread. Outside a dispatcher worker there is nothing to park and None is returned.
+        """
+        chat = getattr(self._local, "chat", None)
+        if chat is None:
+            return None
+        with self._lock:
+            self._held.add(chat)
+
+        def resume(followup=None):
+            with self._lock:
+                self._held.discard(chat)
+                if followup is not None:
+                    self._pending.setdefault(chat, deque()).appendleft((followup, time.monotonic()))
+                self._schedule(chat)
+        return resume
+
+    def _run(self, chats):
+        while True:
+            chat = chats.get()
+            with self._lock:
+                self._scheduled.discard(chat)
+                item, queued_at = self._pending[chat].popleft()
+                if not self._pending[chat]:
+                    del self._pending[chat]
+                started = time.monotonic()
+                self._running[chat] = started
+            self._local.chat = chat
+            try:
+                if callable(item):
+                    item()
+                else:
+                    self._process([item])
+            except Exception:
+                self.failed += 1
+                logger.exception("Work for chat %s failed", chat)
+            finally:
+                self._local.chat = None
+            with self._lock:
+                self._waits.append(started - queued_at)
+                self.processed += 1
+                del self._running[chat]
+                if not self._depth(chat):
+                    self._overflowing.discard(chat)
+                self._schedule(chat)
+
+    def stats(self):
+        """
+        Backlog, drop counts, queue wait percentiles (ms) over the last WAIT_SAMPLES updates, and the
+        age of the oldest update still waiting or running, which grows when a worker is stuck.
+        """
+        now = time.monotonic()
+        with self._lock:
+            waits = sorted(self._waits)
+            depths = [self._depth(chat) for chat in set(self._pending) | set(self._running)]
+            since = [items[0][1] for items in self._pending.values()] + list(self._running.values())
+            out = {"workers": self.workers, "pending": sum(depths), "busiest_chat": max(depths, default=0),
+                   "held_chats": len(self._held), "processed": self.processed, "dropped": self.dropped,
+                   "failed": self.failed}
+        out["oldest_pending_s"] = round(now - min(since), 1) if since else None
+        for p in (50, 90, 99):
+            out[f"wait_p{p}_ms"] = round(waits[min(len(waits) - 1, len(waits) * p // 100)] * 1000, 1) if waits else None
+        out["wait_max_ms"] = round(waits[-1] * 1000, 1) if waits else None
+        return out
+
+    def install(self, bot):
+        """
+        Route bot.process_new_updates through the dispatcher. The polling offset is advanced here,
+        before the updates are handled, so the next getUpdates does not fetch them again.
+        """
+        def dispatch(updates):
+            for update in updates:
+                if update.update_id > bot.last_update_id:
+                    bot.last_update_id = update.update_id
+            self.submit(updates)
+
+        bot.process_new_updates = dispatch
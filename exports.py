@@ -0,0 +1,131 @@
+# exports.py
+# /summary_log exports: full history, or only the summary events added since an admin's previous export.
+import os
+import csv
+import json
+import threading
+from itertools import islice
+
+from openpyxl import Workbook
+
+from storage import HEADERS, SCHEMAS
+from workbook import read_table
+
+FORMATS = ("xlsx", "csv")
+
+# Kept in each tenant's data directory, next to its partitions
+CURSOR_FILE = "export_cursors.json"
+
+
+class ExportCursors:
+    """
+    Position of each admin's last export in the summary log: {admin id: {"month", "rows", "at"}}.
+    The summary log is append-only and partitioned by event time, so (month, rows already
+    exported from that month) is a stable position. Rewritten atomically on change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cursors = None
+
+    def _load(self):
+        if self._cursors is None:
+            self._cursors = {}
+            if os.path.exists(self.path):
+                with open(self.path, encoding="utf-8") as f:
+                    self._cursors = json.load(f)
+        return self._cursors
+
+    def get(self, admin_id):
+        with self._lock:
+            return self._load().get(str(admin_id))
+
+    def set(self, admin_id, cursor):
+        with self._lock:
+            cursors = dict(self._load(), **{str(admin_id): cursor})
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(cursors, f, indent=1)
+            os.replace(tmp, self.path)
+            self._cursors = cursors
+
+
+def _summary_months(store, since_month):
+    """(month, [paths]) of summary partitions from since_month on, oldest first."""
+    months = {}
+    for month, path in store.partition_files("summary"):
+        if since_month is None or month >= since_month:
+            months.setdefault(month, []).append(path)
+    return sorted(months.items())
+
+
+def summary_since(store, cursor, at):
+    """
+    Summary rows appended after cursor (everything when cursor is None) and the cursor past them.
+    Only the cursor's month and later partitions are opened.
+    """
+    since_month, done = (cursor["month"], cursor["rows"]) if cursor else (None, 0)
+    rows = []
+    new_cursor = cursor or {"month": None, "rows": 0}
+    for month, paths in _summary_months(store, since_month):
+        month_rows = (row for path in paths for row in read_table(path, SCHEMAS["summary"]))
+        skip = done if month == since_month else 0
+        added = list(islice(month_rows, skip, None))
+        rows += added
+        new_cursor = {"month": month, "rows": skip + len(added)}
+    return rows, dict(new_cursor, at=at)
+
+
+def end_cursor(store, at):
+    """Cursor at the current end of the summary log, reading only its newest month."""
+    months = _summary_months(store, None)
+    if not months:
+        return {"month": None, "rows": 0, "at": at}
+    return summary_since(store, {"month": months[-1][0], "rows": 0}, at)[1]
+
+
+# === Writers ===
+# sheets: list of (title, headers, rows); returns the paths written
+def write_xlsx(path, sheets):
+    wb = Workbook()
+    wb.remove(wb.active)
+    for title, headers, rows in sheets:
+        ws = wb.create_sheet(title)
+        ws.append(headers)
+        for row in rows:
+            ws.append(list(row))
+    if not wb.worksheets:
+        wb.create_sheet("Empty").append(["No data."])
+    wb.save(path)
+    return [path]
+
+
+def write_csv(path, sheets):
+    """One CSV per sheet: <path stem>-<title>.csv, or path itself for a single sheet."""
+    stem = path[:-len(".csv")] if path.endswith(".csv") else path
+    paths = []
+    for title, headers, rows in sheets:
+        out = path if len(sheets) == 1 else f"{stem}-{title}.csv"
+        with open(out, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(rows)
+        paths.append(out)
+    return paths
+
+
+WRITERS = {"xlsx": write_xlsx, "csv": write_csv}
+
+
+def full_sheets(store):
+    """Full bookings and cancellations history, hot and archived partitions."""
+    sheets = []
+    for table in ("bookings", "cancellations"):
+        if store.list_months(table):
+            sheets.append((table.capitalize(), HEADERS[table], store.read_rows(table)))
+    return sheets
+
+
+def delta_sheets(rows):
+    return [("Changes", HEADERS["summary"], rows)]
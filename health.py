@@ -0,0 +1,55 @@
+# health.py
+# Registry of health checks served by keep_alive.py on /healthz and /readyz.
+import time
+import threading
+
+# Wall-clock timestamps of bot activity, updated from main.py
+activity = {
+    "last_poll": None,       # last successful getUpdates round trip
+    "last_update": None,     # last update the handlers finished with
+    "scheduler_run": None,   # last completed reminder-loop iteration
+}
+
+
+def mark(key):
+    activity[key] = time.time()
+
+
+def age(key):
+    """Seconds since the activity was last marked, or None if it never happened."""
+    stamp = activity[key]
+    return None if stamp is None else time.time() - stamp
+
+
+class HealthMonitor:
+    """
+    Named checks returning (ok, value). Liveness runs the checks registered with ready_only=False;
+    readiness runs all of them.
+    """
+
+    def __init__(self):
+        self._checks = []
+        self._lock = threading.Lock()
+
+    def register(self, name, check, ready_only=False):
+        with self._lock:
+            self._checks.append((name, check, ready_only))
+
+    def run(self, ready):
+        results = {}
+        healthy = True
+        with self._lock:
+            checks = list(self._checks)
+        for name, check, ready_only in checks:
+            if ready_only and not ready:
+                continue
+            try:
+                ok, value = check()
+            except Exception as e:
+                ok, value = False, f"{type(e).__name__}: {e}"
+            results[name] = {"ok": bool(ok), "value": value}
+            healthy = healthy and bool(ok)
+        return healthy, results
+
+
+monitor = HealthMonitor()
@@ -0,0 +1,178 @@
+# jobs.py
+# Background jobs for heavy admin work (exports, stats) so the update thread never waits on them.
+import time
+import queue
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job at its next checkpoint after cancel() was requested."""
+
+
+class QueueFull(Exception):
+    """More jobs are waiting than the queue allows."""
+
+
+class Job:
+    """
+    One unit of background work. The job function receives the Job, reports through
+    progress(), which also serves as the cancellation checkpoint, and may return a one-line result.
+    """
+
+    def __init__(self, job_id, name, owner, chat_id, func, edit, progress_interval):
+        self.id = job_id
+        self.name = name
+        self.owner = owner
+        self.chat_id = chat_id
+        self.func = func
+        self.status = QUEUED
+        self.detail = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.message_id = None  # progress message, edited in place
+        self.shown = None       # text last shown in it
+        self._edit = edit
+        self._interval = progress_interval
+        self._last_edit = 0.0
+        self._edit_lock = threading.Lock()  # the first edit posts the message, later ones edit it
+        self._cancel = threading.Event()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def request_cancel(self):
+        self._cancel.set()
+
+    def describe(self):
+        elapsed = (self.finished or time.time()) - (self.started or self.created)
+        text = f"Job #{self.id} {self.name}: {self.status}"
+        if self.status != QUEUED:
+            text += f" ({elapsed:.1f}s)"
+        return text + (f" – {self.detail}" if self.detail else "")
+
+    def progress(self, detail, force=False):
+        """Update the progress message (throttled) and stop here if the job was cancelled."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.detail = detail
+        now = time.monotonic()
+        if force or now - self._last_edit >= self._interval:
+            self._last_edit = now
+            self.notify()
+
+    def notify(self):
+        with self._edit_lock:
+            try:
+                self._edit(self)
+            except Exception:
+                logger.exception("Could not update progress of job #%s", self.id)
+
+    def track(self, rows, label, every=500):
+        """Pass rows through, reporting the running count and checking for cancellation every `every` rows."""
+        count = 0
+        for row in rows:
+            count += 1
+            if count % every == 0:
+                self.progress(f"{label}: {count} rows")
+            yield row
+
+
+class JobQueue:
+    """
+    Bounded FIFO served by a fixed number of worker threads, started on first use.
+    Finished jobs are kept (up to `history`) so /jobs can show them.
+    edit(job) posts or edits the job's progress message.
+    """
+
+    def __init__(self, edit, workers=2, max_pending=20, history=50, progress_interval=2.0):
+        self._edit = edit
+        self.workers = workers
+        self.progress_interval = progress_interval
+        self.history = history
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start_workers(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for _ in range(self.workers - len(self._threads)):
+                thread = threading.Thread(target=self._run, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, name, owner, chat_id, func):
+        """Queue func(job); raises QueueFull when max_pending jobs are already waiting."""
+        job = Job(next(self._ids), name, owner, chat_id, func, self._edit, self.progress_interval)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.status in FINISHED]
+            for old in finished[:max(0, len(finished) - self.history)]:
+                del self._jobs[old.id]
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFull() from None
+        self._start_workers()
+        job.notify()
+        return job
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, owner=None):
+        with self._lock:
+            return [j for j in self._jobs.values() if owner is None or j.owner == owner]
+
+    def cancel(self, job_id, owner=None):
+        """Request cancellation; queued jobs never start, running ones stop at their next checkpoint."""
+        job = self.get(job_id)
+        if job is None or (owner is not None and job.owner != owner) or job.status in FINISHED:
+            return None
+        job.request_cancel()
+        return job
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, job):
+        if job.cancel_requested:
+            job.status, job.detail = CANCELLED, ""
+            job.finished = time.time()
+            job.notify()
+            return
+        job.status, job.started = RUNNING, time.time()
+        try:
+            job.progress("started", force=True)
+            result = job.func(job)
+            job.status, job.detail = DONE, result or ""
+        except JobCancelled:
+            job.status, job.detail = CANCELLED, ""
+        except Exception as e:
+            logger.exception("Job #%s %s failed", job.id, job.name)
+            job.status, job.detail = FAILED, f"{type(e).__name__}: {e}"
+        job.finished = time.time()
+        job.notify()
@@ -1,13 +1,27 @@
 # keep_alive.py
-from flask import Flask
+from flask import Flask, jsonify
 from threading import Thread
 
+import health
+
 app = Flask('')
 
 @app.route('/')
 def home():
     return "ShiftBookBot is alive!"
 
+# Liveness: polling and the reminder scheduler are moving
+@app.route('/healthz')
+def healthz():
+    ok, checks = health.monitor.run(ready=False)
+    return jsonify(status="ok" if ok else "degraded", checks=checks), 200 if ok else 503
+
+# Readiness: liveness plus storage probes, queue depth and cache warmth
+@app.route('/readyz')
+def readyz():
+    ok, checks = health.monitor.run(ready=True)
+    return jsonify(status="ready" if ok else "not ready", checks=checks), 200 if ok else 503
+
 def run():
     app.run(host='0.0.0.0', port=8080)
 
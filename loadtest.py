@@ -0,0 +1,528 @@
+# loadtest.py
+# Offline load test: a local stub of the Telegram Bot API plus virtual users driving the real handlers.
+#
+# Usage:
+#   python loadtest.py --users 100                    # synthetic month-opening rush
+#   python loadtest.py --users 100 --record rush.jsonl
+#   python loadtest.py --replay rush.jsonl --speed 10  # replay a recorded update stream
+#
+# Everything runs in a temporary data directory against 127.0.0.1; no network access is needed.
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from collections import Counter, defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from openpyxl import Workbook
+
+FAKE_TOKEN = "123456:LOADTEST"
+
+
+# === Stub Telegram Bot API ===
+class StubTelegramAPI:
+    """
+    Serves getUpdates from an in-memory queue and records everything the bot sends.
+    Only the methods the bot uses are implemented; anything else returns ok with an empty result.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.updates = []
+        self.next_update_id = 1
+        self.sent = []          # outbound calls in arrival order
+        self.next_message_id = 1
+        self.cond = threading.Condition()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def _handle(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if body and self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    params.update({k: v[0] for k, v in parse_qs(body.decode()).items()})
+                result = stub.dispatch(method, params, len(body))
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.api_url = f"http://{host}:{self.port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    # --- inbound (updates for the bot) ---
+    def push_update(self, update):
+        with self.cond:
+            update = dict(update, update_id=self.next_update_id)
+            self.next_update_id += 1
+            self.updates.append(update)
+            self.cond.notify_all()
+        return update["update_id"]
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.time() + timeout
+        with self.cond:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates and time.time() < deadline:
+                self.cond.wait(deadline - time.time())
+            return list(self.updates[:100])
+
+    # --- outbound (calls made by the bot) ---
+    def dispatch(self, method, params, body_size):
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "ShiftBookBot", "username": "shiftbook_bot"}
+        if method in ("deleteWebhook", "answerCallbackQuery"):
+            self._record(method, params, body_size)
+            return True
+
+        chat_id = params.get("chat_id")
+        with self.cond:
+            if method in ("editMessageText", "editMessageReplyMarkup"):
+                message_id = int(params.get("message_id") or 0)
+            else:
+                message_id = self.next_message_id
+                self.next_message_id += 1
+        self._record(method, params, body_size)
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if chat_id else 0, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    def _record(self, method, params, body_size):
+        with self.cond:
+            self.sent.append({
+                "seq": len(self.sent),
+                "time": time.perf_counter(),
+                "method": method,
+                "chat_id": int(params["chat_id"]) if params.get("chat_id") else None,
+                "message_id": int(params["message_id"]) if params.get("message_id") else None,
+                "text": params.get("text", ""),
+                "reply_markup": json.loads(params["reply_markup"]) if params.get("reply_markup") else None,
+                "bytes": body_size,
+            })
+            self.cond.notify_all()
+
+    def wait_for(self, chat_id, since_seq, predicate, timeout=30):
+        """First call to chat_id after since_seq matching predicate, or None on timeout."""
+        deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                for rec in self.sent[since_seq:]:
+                    if rec["chat_id"] == chat_id and predicate(rec):
+                        return rec
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+
+    def seq(self):
+        with self.cond:
+            return len(self.sent)
+
+
+# === Update builders ===
+def _user(uid):
+    return {"id": uid, "is_bot": False, "first_name": f"user{uid}"}
+
+
+def message_update(uid, text, message_id=1):
+    return {"message": {
+        "message_id": message_id, "date": int(time.time()),
+        "from": _user(uid), "chat": {"id": uid, "type": "private"}, "text": text,
+    }}
+
+
+def callback_update(uid, data, message_id):
+    return {"callback_query": {
+        "id": f"{uid}-{time.time_ns()}", "from": _user(uid), "chat_instance": str(uid), "data": data,
+        "message": {"message_id": message_id, "date": int(time.time()), "chat": {"id": uid, "type": "private"}, "text": ""},
+    }}
+
+
+def _buttons(rec, prefix):
+    if not rec or not rec["reply_markup"]:
+        return []
+    rows = rec["reply_markup"].get("inline_keyboard") or rec["reply_markup"].get("keyboard") or []
+    out = []
+    for row in rows:
+        for b in row:
+            data = b.get("callback_data") or b.get("text")
+            if data and data.startswith(prefix):
+                out.append(data)
+    return out
+
+
+# === Virtual user ===
+class VirtualUser:
+    """Runs /start -> login -> /reserve -> pick date -> pick shift through the stub, timing each step."""
+
+    def __init__(self, stub, uid, student_id, name, strategy, rng, recorder):
+        self.stub = stub
+        self.uid = uid
+        self.student_id = student_id
+        self.name = name
+        self.strategy = strategy
+        self.rng = rng
+        self.recorder = recorder
+        self.latencies = defaultdict(list)
+        self.outcome = None
+        self.booked = None
+        self.queued = False
+
+    def _step(self, label, update, predicate):
+        since = self.stub.seq()
+        started = time.perf_counter()
+        self.recorder(update)
+        self.stub.push_update(update)
+        rec = self.stub.wait_for(self.uid, since, predicate)
+        if rec is None:
+            self.outcome = f"timeout:{label}"
+            return None
+        self.latencies[label].append(rec["time"] - started)
+        return rec
+
+    def _pick(self, options):
+        return options[0] if self.strategy == "first" else self.rng.choice(options)
+
+    def run(self):
+        if not self._step("start", message_update(self.uid, "/start"), lambda r: "Student ID" in r["text"]):
+            return
+        if not self._step("student_id", message_update(self.uid, str(self.student_id)), lambda r: "name" in r["text"]):
+            return
+        rec = self._step("name", message_update(self.uid, self.name), lambda r: "Login" in r["text"] or "Invalid" in r["text"])
+        if not rec:
+            return
+        if "Invalid" in rec["text"]:
+            self.outcome = "login_failed"
+            return
+
+        rec = self._step("reserve", message_update(self.uid, "/reserve"),
+                         lambda r: bool(_buttons(r, "rsv:d:")) or "No available" in r["text"])
+        dates = _buttons(rec, "rsv:d:")
+        if not dates:
+            self.outcome = self.outcome or "no_dates"
+            return
+        picker_id = rec["message_id"]
+
+        rec = self._step("pick_date", callback_update(self.uid, self._pick(dates), picker_id),
+                         lambda r: r["method"] == "editMessageText" and r["message_id"] == picker_id)
+        shifts = _buttons(rec, "rsv:s:")
+        if not shifts:
+            self.outcome = self.outcome or "no_shifts"
+            return
+
+        choice = self._pick(shifts)
+        queued_before = self.stub.seq()
+        rec = self._step("pick_shift", callback_update(self.uid, choice, picker_id),
+                         lambda r: r["method"] == "editMessageText" and r["message_id"] == picker_id
+                         and "Select" not in r["text"] and "in the queue" not in r["text"])
+        if not rec:
+            return
+        self.queued = self.stub.wait_for(self.uid, queued_before, lambda r: "in the queue" in r["text"], timeout=0) is not None
+        if rec["text"].startswith("Booking confirmed"):
+            _, _, date_str, shift = choice.split(":", 3)
+            self.booked = (date_str, shift)
+            self.outcome = "booked"
+        else:
+            self.outcome = "refused"
+
+
+# === Harness ===
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def make_students(path, count):
+    """Synthetic roster; every other student may take night shifts."""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["StudentID", "Name", "Contact", "NightShift", "IsAdmin", "SpecialUser"])
+    students = []
+    for i in range(count):
+        sid = 3000000 + i
+        name = "Load" + "".join(chr(ord("a") + int(d)) for d in str(i))
+        ws.append([sid, name, 80000000 + i, 1 if i % 2 == 0 else 0, 0, 0])
+        students.append((sid, name))
+    wb.save(path)
+    return students
+
+
+def start_bot(stub, workdir, rush_mode="auto"):
+    """Import main inside workdir with the Bot API pointed at the stub, and start polling."""
+    os.environ["BOT_TOKEN"] = FAKE_TOKEN
+    os.environ["DATA_DIR"] = workdir
+    os.environ["RUSH_MODE"] = rush_mode
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import logging
+    import telebot
+    telebot.apihelper.API_URL = stub.api_url
+    import main
+    telebot.logger.setLevel(logging.WARNING)
+
+    thread = threading.Thread(
+        target=main.bot.polling,
+        kwargs={"non_stop": True, "interval": 0, "timeout": 1, "long_polling_timeout": 1},
+        daemon=True,
+    )
+    thread.start()
+    return main
+
+
+def verify_storage(main_module, confirmed):
+    """
+    Compare what users were told (Counter of (student id, date, shift) confirmations) against
+    what ended up in the bookings partitions; overbooking is checked from storage alone.
+    """
+    import storage
+    from datetime import datetime
+
+    tenant = main_module.get_tenant()
+    rows = Counter()
+    per_slot = Counter()
+    for sid, day, shift in tenant.store.read_rows("bookings", fields=("student_id", "date", "shift")):
+        date_key = storage.day_key(day)
+        rows[(str(sid), date_key, shift)] += 1
+        per_slot[(date_key, shift)] += 1
+
+    overbooked = {
+        slot: count for slot, count in per_slot.items()
+        if count > tenant.shift_capacity(slot[1], datetime.strptime(slot[0], "%Y-%m-%d").date())
+    }
+    lost = sum(max(0, n - rows[key]) for key, n in confirmed.items())
+    phantom = sum(max(0, n - confirmed[key]) for key, n in rows.items())
+    return overbooked, lost, phantom
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="shiftbook-loadtest-")
+    stub = StubTelegramAPI().start()
+    record_file = open(args.record, "w", encoding="utf-8") if args.record else None
+    record_lock = threading.Lock()
+
+    def recorder(update):
+        if record_file:
+            with record_lock:
+                record_file.write(json.dumps(dict(update, ts=time.time())) + "\n")
+
+    try:
+        students = make_students(os.path.join(workdir, "students.xlsx"), max(args.users, 1))
+        main_module = start_bot(stub, workdir, "on" if args.rush else "off")
+        if args.rush:
+            import rush
+            main_module.get_tenant().rush.tick(datetime.now(rush.SG))
+
+        started = time.perf_counter()
+        users, pushes = [], []
+        if args.replay:
+            pushes = replay(stub, args.replay, args.speed)
+        else:
+            rng = random.Random(args.seed)
+            users = [
+                VirtualUser(stub, 10_000 + i, sid, name, args.strategy, random.Random(rng.random()), recorder)
+                for i, (sid, name) in enumerate(students[:args.users])
+            ]
+            threads = [threading.Thread(target=u.run) for u in users]
+            for t in threads:
+                t.start()
+                if args.ramp:
+                    time.sleep(args.ramp / len(threads))
+            for t in threads:
+                t.join()
+        # Let trailing notifications drain
+        time.sleep(args.settle)
+        elapsed = time.perf_counter() - started
+
+        report(stub, users, pushes, elapsed, main_module)
+    finally:
+        main_module = sys.modules.get("main")
+        if main_module is not None:
+            main_module.bot.stop_polling()
+        stub.stop()
+        if record_file:
+            record_file.close()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Data kept in {workdir}")
+
+
+def replay(stub, path, speed):
+    """
+    Push recorded updates, keeping their original spacing divided by speed.
+    Returns [(chat id, step label, update, pushed at)] for match_replies.
+    """
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    pushes = []
+    previous = None
+    for update in updates:
+        ts = update.pop("ts", None)
+        update.pop("update_id", None)
+        if previous is not None and ts is not None and speed > 0:
+            time.sleep(max(0.0, (ts - previous) / speed))
+        previous = ts if ts is not None else previous
+        chat_id, label = replay_step(update)
+        pushes.append((chat_id, label, update, time.perf_counter()))
+        stub.push_update(update)
+    return pushes
+
+
+def replay_step(update):
+    """(chat id, label) of a replayed update: the command, "text", or the callback data prefix."""
+    if "callback_query" in update:
+        call = update["callback_query"]
+        return call["message"]["chat"]["id"], ":".join(call.get("data", "").split(":")[:2])
+    message = update.get("message") or {}
+    text = message.get("text", "")
+    return message.get("chat", {}).get("id"), text.split()[0] if text.startswith("/") else "text"
+
+
+def match_replies(stub, pushes):
+    """
+    Latency per label of replayed updates: each pushed update is matched to the bot's next
+    outbound call for the same chat that has not been matched to an earlier update yet.
+    """
+    outbound = defaultdict(list)
+    with stub.cond:
+        for rec in stub.sent:
+            if rec["chat_id"] is not None:
+                outbound[rec["chat_id"]].append(rec)
+    latencies = defaultdict(list)
+    unanswered = 0
+    cursor = Counter()
+    for chat_id, label, _, pushed_at in pushes:
+        replies = outbound[chat_id]
+        i = cursor[chat_id]
+        while i < len(replies) and replies[i]["time"] < pushed_at:
+            i += 1
+        if i == len(replies):
+            unanswered += 1
+        else:
+            latencies[label].append(replies[i]["time"] - pushed_at)
+            i += 1
+        cursor[chat_id] = i
+    return latencies, unanswered
+
+
+CONFIRMED = re.compile(r"Booking confirmed for (\d{4}-\d{2}-\d{2}) \((\w+)\)")
+
+def replayed_confirmations(stub, pushes):
+    """Booking confirmations the bot sent during a replay, keyed by the student id each chat logged in with."""
+    student_of = {}
+    for chat_id, label, update, _ in pushes:
+        text = update.get("message", {}).get("text", "")
+        if label == "text" and text.isdigit() and len(text) == 7:
+            student_of[chat_id] = text
+    confirmed = Counter()
+    for rec in stub.sent:
+        match = CONFIRMED.match(rec["text"] or "")
+        if match and rec["chat_id"] in student_of:
+            confirmed[(student_of[rec["chat_id"]],) + match.groups()] += 1
+    return confirmed
+
+
+def print_latencies(latencies, labels):
+    print("Step latency (ms):      p50      p90      p99      max")
+    for label in labels:
+        values = latencies.get(label)
+        if values:
+            print(f"  {label:<14}" + "".join(f"{percentile(values, p) * 1000:9.1f}" for p in (50, 90, 99, 100)))
+
+
+def report(stub, users, pushes, elapsed, main_module):
+    methods = Counter(rec["method"] for rec in stub.sent)
+    print(f"Elapsed: {elapsed:.2f}s")
+    print(f"Outbound API calls: {len(stub.sent)} " + ", ".join(f"{m}={n}" for m, n in methods.most_common()))
+    print(f"Outbound bytes (documents): {sum(r['bytes'] for r in stub.sent if r['method'] == 'sendDocument')}")
+
+    if users:
+        outcomes = Counter(u.outcome for u in users)
+        booked = outcomes.get("booked", 0)
+        print(f"Users: {len(users)} " + ", ".join(f"{k}={v}" for k, v in outcomes.most_common()))
+        print(f"Queued behind others (rush mode): {sum(u.queued for u in users)}")
+        print(f"Throughput: {booked / elapsed:.1f} bookings/s, {len(users) / elapsed:.1f} dialogs/s")
+
+        labels = ["start", "student_id", "name", "reserve", "pick_date", "pick_shift"]
+        print_latencies({label: [v for u in users for v in u.latencies[label]] for label in labels}, labels)
+        confirmed = Counter((str(u.student_id),) + u.booked for u in users if u.booked)
+    else:
+        latencies, unanswered = match_replies(stub, pushes)
+        print(f"Replayed updates: {len(pushes)}, chats {len({chat for chat, _, _, _ in pushes})}, unanswered {unanswered}")
+        print_latencies(latencies, sorted(latencies))
+        confirmed = replayed_confirmations(stub, pushes)
+
+    overbooked, lost, phantom = verify_storage(main_module, confirmed)
+    print(f"Overbooked slots: {len(overbooked)} {overbooked if overbooked else ''}")
+    print(f"Lost bookings (confirmed but not stored): {lost}")
+    print(f"Unconfirmed stored bookings: {phantom}")
+
+    stats = main_module.get_tenant().store.write_stats
+    avg_wait = stats["wait_seconds"] / stats["writes"] * 1000 if stats["writes"] else 0.0
+    print(f"Storage writes: {stats['writes']}, lock wait avg {avg_wait:.1f}ms, max {stats['max_wait'] * 1000:.1f}ms")
+
+    dispatch = main_module.update_dispatcher.stats()
+    print(f"Update dispatch: {dispatch['workers']} workers, {dispatch['processed']} processed, "
+          f"{dispatch['dropped']} dropped, queue wait p50 {dispatch['wait_p50_ms']}ms, "
+          f"p90 {dispatch['wait_p90_ms']}ms, max {dispatch['wait_max_ms']}ms")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Telegram update streams against the bot through a local stub API.")
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--strategy", choices=["first", "random"], default="first",
+                        help="'first' makes everyone race for the earliest slot (month-opening rush)")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which users are started")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rush", action="store_true", help="force rush mode (pre-warm + FIFO admission queue)")
+    parser.add_argument("--record", help="write the synthetic update stream to this JSONL file")
+    parser.add_argument("--replay", help="replay updates from a JSONL file instead of synthetic users")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up factor (0 = as fast as possible)")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to wait for trailing messages")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary data directory")
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,16 +1,32 @@
 # main.py
 import telebot
 import os
+import shutil
 import tempfile # Export summary log to excel
 from keep_alive import keep_alive  # For Replit uptime
 
 from datetime import datetime, timedelta
 import threading
+import functools
 import time
-from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InputFile
-import pytz
-
-from openpyxl import load_workbook, Workbook
+import atexit
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InputFile, InlineKeyboardMarkup, InlineKeyboardButton
+
+import storage
+import stats
+import exports
+from digest import DigestNotifier
+from conversation import ConversationStore, SessionStore, make_backend
+from rush import RushMode, window_open
+import profiling
+from profiling import profiled
+from jobs import JobQueue, QueueFull, FINISHED
+from dispatch import ChatDispatcher
+import health
+from utils import SG_TZ, SHIFT_OPTIONS
+from records import Shift, Booking, student_key
+from tenants import load_tenants
+from roster import PRESENT, ABSENT
 
 # Load your token from environment
 from dotenv import load_dotenv
@@ -22,99 +38,148 @@ telebot.logger.setLevel(logging.DEBUG)
 # === Load Telegram token ===
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
-bot = telebot.TeleBot(TOKEN)
+# Handlers run on the update dispatcher's workers (see below), not on TeleBot's own thread pool
+bot = telebot.TeleBot(TOKEN, threaded=False)
 
 # === Telegram Group IDs ===
 # G1 receive all, G2 cancel and rebook
 GROUP_1_CHAT_ID = -1002635519712
-#GROUP_2_CHAT_ID = 
+GROUP_2_CHAT_ID = int(os.getenv("GROUP_2_CHAT_ID")) if os.getenv("GROUP_2_CHAT_ID") else None
 
-# === Track cancelled shifts to catch rebook events ===
-cancelled_shifts = set()
+# === Group notification digest ===
+# DIGEST_WINDOW (seconds) batches group messages into one digest per window; 0 sends each event immediately
+DIGEST_WINDOW = int(os.getenv("DIGEST_WINDOW", "0"))
+digest = DigestNotifier(bot.send_message, DIGEST_WINDOW)
+atexit.register(digest.flush)
+
+# === Update dispatch ===
+# Updates are hashed by chat onto UPDATE_WORKERS threads: one chat's updates are handled strictly
+# in order, other chats proceed in parallel. UPDATE_QUEUE_PER_CHAT bounds what one chat can queue.
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "4"))
+UPDATE_QUEUE_PER_CHAT = int(os.getenv("UPDATE_QUEUE_PER_CHAT", "20"))
+
+def notify_overflow(chat_id, update):
+    if isinstance(chat_id, int):
+        bot.send_message(chat_id, "You are sending faster than the bot can keep up. "
+                                  "Please wait for a reply, then try again.")
+
+_process_new_updates = bot.process_new_updates
 
-def load_cancelled_shifts():
-    """Populate cancelled_shifts from cancellations.xlsx on startup."""
+def process_updates(updates):
+    """Runs on a dispatcher worker; last_update is marked once the handlers are done, not when queued."""
     try:
-        wb = load_workbook(CANCELLATIONS_FILE)
-        ws = wb.active
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            _, _, date, shift = row[:4]
-            cancelled_shifts.add((date, shift))
-    except FileNotFoundError:
-        pass
-
-# === Excel file paths ===
-BOOKINGS_FILE = "bookings.xlsx"
+        _process_new_updates(updates)
+    finally:
+        health.mark("last_update")
+
+update_dispatcher = ChatDispatcher(process_updates, workers=UPDATE_WORKERS,
+                                   max_per_chat=UPDATE_QUEUE_PER_CHAT, on_overflow=notify_overflow)
+update_dispatcher.install(bot)
+
+# === Tenants ===
+# TENANTS_FILE lists the groups/sites served by this process, each with its own shifts, rules,
+# groups and data directory (see tenants.py). Without it, one "default" tenant uses the settings above
+# and the legacy files in the working directory.
 STUDENTS_FILE = "students.xlsx"
-CANCELLATIONS_FILE = "cancellations.xlsx"
-SUMMARY_FILE = "summary.xlsx"
 
-# Run loader
-load_cancelled_shifts()
+TENANTS, DEFAULT_TENANT = load_tenants(
+    os.getenv("TENANTS_FILE", "tenants.json"),
+    data_dir=storage.DATA_DIR,
+    students_file=STUDENTS_FILE,
+    legacy_dir=".",
+    group_1_chat_id=GROUP_1_CHAT_ID,
+    group_2_chat_id=GROUP_2_CHAT_ID,
+    shifts=SHIFT_OPTIONS,
+)
 
-# === Shift definitions ===
-SHIFT_OPTIONS = {
-    "Morning": ("09:00", "12:00"),
-    "Afternoon": ("14:00", "18:00"),
-    "Night": ("18:00", "22:00")
-}
+# === Track cancelled shifts to catch rebook events ===
+def load_cancelled_shifts(tenant):
+    """Populate cancelled_shifts from the current and upcoming cancellation partitions on startup."""
+    today = datetime.now(SG_TZ).date()
+    for date, shift in tenant.store.read_rows("cancellations", start=today, fields=("date", "shift")):
+        tenant.cancelled_shifts.add((storage.day_key(date), shift))
 
-# Cache login state using student ID as key
-logged_in_users = {}
+def prepare_storage(tenant):
+    # Legacy single-file tables; their rows are split into month partitions on first run (see storage.py)
+    for table in ("bookings", "cancellations", "summary"):
+        tenant.store.migrate_legacy(table, tenant.legacy_file(table))
+    tenant.store.rotate_archive(datetime.now(SG_TZ).date())
 
-# === Helper function to check if a student is valid (based on students.xlsx) ===
-def is_valid_student(student_id, name):
-    wb = load_workbook("students.xlsx")
-    ws = wb.active
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        if str(row[0]) == str(student_id) and row[1].lower() == name.lower():
-            return True
-    return False
+    # Run loader
+    load_cancelled_shifts(tenant)
 
-# === Session cache ===
-logged_in_users = {}
+for _tenant in TENANTS.values():
+    prepare_storage(_tenant)
 
-def notify_group1(msg): bot.send_message(GROUP_1_CHAT_ID, msg)
-def notify_group2(msg): bot.send_message(GROUP_2_CHAT_ID, msg)
+# === Session cache ===
+# user id -> {"student_id", "tenant"}; name and admin/LIC/night flags are read from the students file
+# on each use (get_session_student), so changes to it apply without a new login.
+# SESSION_STORE (same formats as CONVERSATION_STORE, default sessions.json in DATA_DIR, empty to keep
+# sessions in memory only) lets logins and open /reserve pickers survive a restart.
+SESSION_STORE = os.getenv("SESSION_STORE", os.path.join(storage.DATA_DIR, "sessions.json"))
+logged_in_users = SessionStore(
+    ttl=int(os.getenv("SESSION_TTL", str(30 * 24 * 3600))),
+    backend=make_backend(SESSION_STORE),
+)
+atexit.register(logged_in_users.flush)
+
+# === Pending dialog steps (/start, /cancel) ===
+# CONVERSATION_STORE: optional path (*.db for SQLite, anything else for a JSON file) so dialogs survive restarts
+conversations = ConversationStore(
+    ttl=int(os.getenv("CONVERSATION_TTL", "900")),
+    max_entries=int(os.getenv("CONVERSATION_MAX", "5000")),
+    backend=make_backend(os.getenv("CONVERSATION_STORE")),
+)
+atexit.register(conversations.flush)
+
+# All tenants share one digest dispatcher; each tenant only picks the target groups
+def notify_group1(tenant, msg, urgent=False):
+    if tenant.group_1_chat_id is not None:
+        digest.notify(tenant.group_1_chat_id, msg, urgent)
+def notify_group2(tenant, msg, urgent=False):
+    if tenant.group_2_chat_id is not None:
+        digest.notify(tenant.group_2_chat_id, msg, urgent)
 
 # Help function to retrieve studentID properly
 # Helper to get student_id from session
-def get_student_info(student_id):
-    if not os.path.exists(STUDENTS_FILE):
-        return None
-    wb = load_workbook(STUDENTS_FILE)
-    ws = wb.active
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        if str(row[0]) == str(student_id):
-            return row # Make sure it returns full row
-    return None
+# Rows are cached per tenant and reloaded only when its students file changes on disk (see tenants.py)
+def get_student_info(tenant, student_id):
+    return tenant.student_info(student_id)
 
 # Help function for writing to summary log
-def log_to_summary(action, sid, name, date, shift):
-    timestamp = datetime.now(pytz.timezone("Asia/Singapore")).strftime("%Y-%m-%d %H:%M:%S")
-    if not os.path.exists(SUMMARY_FILE):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Summary"
-        ws.append(["Timestamp","Action","StudentID","Name","Date","Shift","LIC","LIC Verified"])
-    else:
-        wb = load_workbook(SUMMARY_FILE)
-        ws = wb.active
-    ws.append([timestamp, action, sid, name, date, shift, "N/A", "N/A"])
-    wb.save(SUMMARY_FILE)
+def log_to_summary(tenant, action, sid, name, date, shift):
+    log_many_to_summary(tenant, action, sid, name, [(date, shift)])
+
+# Several events of one student in a single summary write
+def log_many_to_summary(tenant, action, sid, name, slots):
+    timestamp = datetime.now(SG_TZ).strftime("%Y-%m-%d %H:%M:%S")
+    tenant.store.append_rows("summary", [[timestamp, action, sid, name, date, shift, "N/A", "N/A"] for date, shift in slots])
 
 # Bot manual
 # Manual/help message to guide user
-def send_manual(chat_id):
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+def send_manual(chat_id, tenant=None):
+    tenant = tenant or get_tenant()
+    rules = tenant.rules
+    night_days = "/".join(WEEKDAY_NAMES[d] for d in tenant.night_weekdays)
     manual = ("User Manual\n\n"
               "Login: /start\n"
               "Reserve: /reserve new shift\n"
               "Cancel: /cancel booked shift\n"
+              "Recurring: /recurring Morning Tue 8 books a shift every week\n"
               "MyShifts: /mybookings view upcoming booked shift\n"
-              "Summary: PODs can use /summary_log to export all bookings.\n\n"
+              "Summary: PODs can use /summary_log to export all bookings, /summary_log delta for changes "
+              "since their last export (add csv for CSV).\n"
+              "Stats: PODs can use /stats for fill and cancellation rates.\n"
+              "Roster: PODs and LICs can use /roster [YYYY-MM-DD] for who is on each shift, "
+              "/verify [YYYY-MM-DD] to mark attendance.\n"
+              "Profile: PODs can use /profile to sample slow handlers.\n"
+              "Jobs: PODs can use /jobs to follow exports and /cancel_job <id> to stop one.\n\n"
               "Shift Rules:\n"
-              "• Max 4/2 shifts/week (unless within 48 hours / 5 days).\n"
-              "• Night shifts only for selected SCs (Wed/Thu).\n"
+              f"• Max {rules['max_per_week']}/{rules['max_per_week_special']} shifts/week "
+              f"(unless within {rules['cap_exempt_hours_special']} hours / {rules['cap_exempt_days']} days).\n"
+              f"• Night shifts only for selected SCs ({night_days}).\n"
               "• You can book Morning + Afternoon, but NOT Afternoon + Night.\n\n"
               "If you encounter issues, please drop a text in SC chat."
               )
@@ -122,17 +187,33 @@ def send_manual(chat_id):
 
 def is_logged_in(uid): return uid in logged_in_users
 def get_student_id_from_session(uid): return logged_in_users.get(uid, {}).get("student_id")
+def get_tenant(key=None): return TENANTS.get(key) or TENANTS[DEFAULT_TENANT]
+def get_tenant_from_session(uid): return get_tenant(logged_in_users.get(uid, {}).get("tenant"))
+
+LOGIN_AGAIN = "Your student record was not found. Please log in again with /start."
+
+def get_session_student(uid):
+    """
+    (tenant, Student) of a logged-in user, looked up in the students file each time; the Student is
+    None when the student has been removed from it, and both are None when the user is not logged in.
+    """
+    session = logged_in_users.get(uid)
+    if not session or "student_id" not in session:
+        return None, None
+    tenant = get_tenant(session.get("tenant"))
+    return tenant, get_student_info(tenant, session["student_id"])
+
+def get_admin_user(message):
+    """(tenant, Student) of a logged-in admin, or None."""
+    tenant, student = get_session_student(message.from_user.id)
+    if student is not None and student.is_admin:
+        return tenant, student
+    return None
 
-def get_user_bookings(student_id):
-    if not os.path.exists(BOOKINGS_FILE): return []
-    wb = load_workbook(BOOKINGS_FILE)
-    ws = wb.active
-    out = []
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        timestamp, sid, name, date_str, shift = row[:5]
-        if str(sid) == str(student_id):
-            out.append({"date": datetime.strptime(date_str, "%Y-%m-%d").date(), "shift": shift})
-    return out
+def get_user_bookings(tenant, student_id):
+    """Bookings of a student from the tenant's in-memory index, which covers the Monday of the current week onwards."""
+    today = datetime.now(SG_TZ).date()
+    return tenant.index.refresh(today).user_bookings(student_id)
 
 # === Handlers: manual, start, reserve, cancel, mybookings, summary_log ===
 # /Manual commond handler
@@ -141,176 +222,464 @@ def manual_handler(msg):
     send_manual(msg.chat.id)
 
 # /Start commond handler
+# "/start <tenant>" (also what a t.me/<bot>?start=<tenant> deep link sends) logs in to that tenant;
+# plain /start finds the tenant whose students file lists the student.
 @bot.message_handler(commands=['start'])
 def start_handler(msg):
+    args = msg.text.split()[1:]
+    tenant_key = args[0] if args else None
+    if tenant_key is not None and tenant_key not in TENANTS:
+        bot.send_message(msg.chat.id, f"Unknown site '{tenant_key}'. Use /start or /start <{'|'.join(TENANTS)}>.")
+        return
     bot.send_message(msg.chat.id, "Enter your Student ID:")
-    bot.register_next_step_handler(msg, get_student_id)
+    conversations.set(msg.chat.id, "student_id", tenant=tenant_key)
 
-def get_student_id(msg):
+def get_student_id(msg, tenant=None):
     sid = msg.text.strip()
     if not (sid.isdigit() and len(sid)==7):
         bot.send_message(msg.chat.id, "Invalid ID. Use /start again.")
         return
     bot.send_message(msg.chat.id, "Enter your name:")
-    bot.register_next_step_handler(msg, get_student_name, sid)
+    conversations.set(msg.chat.id, "student_name", sid=sid, tenant=tenant)
 
-def get_student_name(msg, sid):
+def get_student_name(msg, sid, tenant=None):
     name = msg.text.strip()
     if not name.isalpha():
         bot.send_message(msg.chat.id, "Invalid name. Use /start again.")
         return
-    info = get_student_info(sid)
-    if info and info[1].lower()==name.lower():
-        logged_in_users[msg.from_user.id] = {"student_id": sid, "name": name, "is_admin": len(info)>4 and info[4]==1}
+    candidates = [TENANTS[tenant]] if tenant in TENANTS else list(TENANTS.values())
+    matches = []
+    for t in candidates:
+        info = get_student_info(t, sid)
+        if info and info.name.lower()==name.lower():
+            matches.append((t, info))
+    if len(matches) > 1:
+        bot.send_message(msg.chat.id, "You are registered at several sites. Use /start <site> with one of: "
+                                      + ", ".join(t.key for t, _ in matches))
+        return
+    if matches:
+        t, info = matches[0]
+        logged_in_users[msg.from_user.id] = {"student_id": sid, "tenant": t.key}
         bot.send_message(msg.chat.id, f"Login success, {name}!")
-        send_manual(msg.chat.id)
+        send_manual(msg.chat.id, t)
     else:
         bot.send_message(msg.chat.id, "Invalid credentials. Use /start again.")
 
 #---Booking---
+# Booking flow: /reserve -> inline date picker -> shift buttons -> confirm.
+# All state lives in the callback data ("rsv:<kind>:<value>") so a restart mid-dialog loses nothing.
+# The tenant comes from the user's session; callback data stays tenant-free.
+DATES_PER_PAGE = 10
+
+def booking_window_open(tenant, selected_date, sg_now):
+    """
+    Bookings for a month open N days before its 1st at the tenant's opening hour, SG time.
+    Same schedule as rush mode's windows (rush.opening_time), so the pre-warm lands on the real opening.
+    """
+    return window_open(selected_date, sg_now, tenant.rules["opening_days_before"], tenant.rules["opening_hour"])
+
+def get_available_shifts(tenant, student_id, selected_date):
+    """Shifts with free capacity on a date that this student may still pick (from the in-memory index)."""
+    # Night shift check (only on the tenant's night weekdays, see Tenant.shift_capacity)
+    student = get_student_info(tenant, student_id)
+    is_night_allowed = student is not None and student.night_shift
+    ordinal = selected_date.toordinal()
+    booked_today = [b.shift.label for b in tenant.index.user_bookings(student_id) if b.ordinal == ordinal]
+
+    available_shifts = []
+    for shift in tenant.shift_options:
+        if tenant.index.count(selected_date, shift) >= tenant.shift_capacity(shift, selected_date):
+            continue
+        if shift == "Night" and not is_night_allowed:
+            continue
+        if shift == "Night" and "Afternoon" in booked_today:
+            continue
+        if shift in booked_today:
+            continue
+        available_shifts.append(shift)
+    return available_shifts
+
+def get_bookable_dates(tenant, student_id, sg_now):
+    """Dates from today up to the end of the open booking window with at least one free shift."""
+    day = sg_now.date()
+    out = []
+    while booking_window_open(tenant, day, sg_now) and len(out) < 100:
+        if get_available_shifts(tenant, student_id, day):
+            out.append(day)
+        day += timedelta(days=1)
+    return out
+
+def check_weekly_cap(tenant, student_info, bookings, selected_date, sg_now):
+    """Return the refusal message when the weekly cap is reached, else None."""
+    special_user = student_info.special_user
+    rules = tenant.rules
+
+    week_start = selected_date.toordinal() - selected_date.weekday()
+    week_end = week_start + 6
+
+    weekly_bookings = [b for b in bookings if week_start <= b.ordinal <= week_end]
+    days_ahead = (selected_date - sg_now.date()).days
+    within_exempt_days = days_ahead < rules["cap_exempt_days"]
+    # Make selected_date into timezone-aware datetime
+    selected_datetime = SG_TZ.localize(datetime.combine(selected_date, datetime.min.time()))
+    within_exempt_hours = (selected_datetime - sg_now).total_seconds() < rules["cap_exempt_hours_special"] * 3600
+
+    if special_user:
+        if len(weekly_bookings) >= rules["max_per_week_special"] and not within_exempt_hours:
+            return (f"Max {rules['max_per_week_special']} shifts/week for your account "
+                    f"(unless within {rules['cap_exempt_hours_special']}h).")
+    else:
+        if len(weekly_bookings) >= rules["max_per_week"] and not within_exempt_days:
+            return f"Max {rules['max_per_week']} shifts/week (unless within next {rules['cap_exempt_days']} days)."
+    return None
+
+def date_picker_markup(tenant, student_id, page_start=None):
+    sg_now = datetime.now(SG_TZ)
+    tenant.index.refresh(sg_now.date())
+    dates = get_bookable_dates(tenant, student_id, sg_now)
+    if not dates:
+        return None
+
+    pos = 0
+    if page_start is not None:
+        pos = next((i for i, d in enumerate(dates) if d >= page_start), max(len(dates) - DATES_PER_PAGE, 0))
+    page = dates[pos:pos + DATES_PER_PAGE]
+
+    markup = InlineKeyboardMarkup(row_width=2)
+    markup.add(*[InlineKeyboardButton(d.strftime("%a %d %b"), callback_data=f"rsv:d:{d}") for d in page])
+    nav = []
+    if pos > 0:
+        nav.append(InlineKeyboardButton("‹ Prev", callback_data=f"rsv:p:{dates[max(pos - DATES_PER_PAGE, 0)]}"))
+    if pos + DATES_PER_PAGE < len(dates):
+        nav.append(InlineKeyboardButton("Next ›", callback_data=f"rsv:p:{dates[pos + DATES_PER_PAGE]}"))
+    if nav:
+        markup.row(*nav)
+    return markup
+
 # /reserve command handler
 @bot.message_handler(commands=['reserve'])
+@profiled("reserve_handler")
 def reserve_handler(message):
     if not is_logged_in(message.from_user.id):
         bot.send_message(message.chat.id, "You are not logged in. Use /start.")
         return
-    user_data = logged_in_users.get(message.from_user.id)
-    if not user_data or "student_id" not in user_data:
-        bot.send_message(message.chat.id, "Session expired or invalid. Use /start.")
+    tenant, student = get_session_student(message.from_user.id)
+    if student is None:
+        bot.send_message(message.chat.id, LOGIN_AGAIN)
         return
 
-    student_id = user_data["student_id"]
-    print(f"[DEBUG] reserve_handler: student_id={student_id}")
-
-    bot.send_message(message.chat.id, "Enter date to book (YYYY-MM-DD):")
-    bot.register_next_step_handler(message, handle_date_selection, student_id)
-
-# handle date input and show available shifts
-def handle_date_selection(message, student_id):
-    print(f"[DEBUG] handle_date_selection: student_id={student_id}, message={message.text}")
+    markup = date_picker_markup(tenant, student.student_id)
+    if markup is None:
+        bot.send_message(message.chat.id, "No available shifts in the current booking window.")
+        return
+    bot.send_message(message.chat.id, "Select a date to book:", reply_markup=markup)
+
+# === Rush mode ===
+# Around each booking-window opening, caches are pre-warmed and shift taps are admitted first come, first served.
+# Every tenant has its own schedule and queue. RUSH_MODE: auto (follow the schedule), on or off.
+def prewarm_for_rush(tenant, month_start):
+    sg_now = datetime.now(SG_TZ)
+    get_student_info(tenant, None)  # loads the students file into the cache
+    tenant.index.refresh(sg_now.date())
+    tenant.store.ensure_partition("bookings", month_start.strftime("%Y-%m"))
+    tenant.store.ensure_partition("summary", sg_now.strftime("%Y-%m"))
+
+for _tenant in TENANTS.values():
+    _tenant.rush = RushMode(
+        functools.partial(prewarm_for_rush, _tenant),
+        lead=timedelta(minutes=int(os.getenv("RUSH_LEAD_MINUTES", "10"))),
+        duration=timedelta(minutes=int(os.getenv("RUSH_DURATION_MINUTES", "30"))),
+        mode=os.getenv("RUSH_MODE", "auto"),
+        opening_days_before=_tenant.rules["opening_days_before"],
+        opening_hour=_tenant.rules["opening_hour"],
+    )
+
+# Inline keyboard taps for the booking flow
+@bot.callback_query_handler(func=lambda call: call.data.startswith("rsv:"))
+def reserve_callback(call):
+    student_id = get_student_id_from_session(call.from_user.id)
+    if not student_id:
+        bot.answer_callback_query(call.id, "You are not logged in. Use /start.")
+        bot.edit_message_text("Your session has expired. Log in again with /start, then use /reserve.",
+                              call.message.chat.id, call.message.message_id)
+        return
+    tenant, student = get_session_student(call.from_user.id)
+    if student is None:
+        bot.answer_callback_query(call.id)
+        bot.edit_message_text(LOGIN_AGAIN, call.message.chat.id, call.message.message_id)
+        return
 
     try:
-        selected_date = datetime.strptime(message.text.strip(), "%Y-%m-%d").date()
-        today = datetime.now(pytz.timezone("Asia/Singapore")).date()
-
-        # Determine if selected month is later than next month
-        next_month = (today.replace(day=1) + timedelta(days=32)).replace(day=1)  # first day of next month
-        selected_first_of_month = selected_date.replace(day=1)
-
-        if selected_first_of_month > next_month:
-            # Booking is for month after next
-            booking_month_start = selected_date.replace(day=1)
-            delta_days = (booking_month_start - today).days
-
-            # Get current SG time
-            sg_now = datetime.now(pytz.timezone("Asia/Singapore"))
-
-            if delta_days > 5 or (delta_days == 5 and sg_now.hour < 18):
-                bot.send_message(message.chat.id, "Booking for that month opens 5 days before 1st of the month at 6PM SG time.")
-                return
-
-        # Night shift check (only Wed/Thu)
-        day_of_week = selected_date.weekday()
-        is_night_allowed = get_student_info(student_id)[3] == 1
-
-        available_shifts = []
-        bookings = get_user_bookings(student_id)
-        booked_today = [b['shift'] for b in bookings if b['date'] == selected_date]
-        shift_counts = {
-            "Morning": 1,
-            "Afternoon": 2,
-            "Night": 2 if day_of_week in [2, 3] and is_night_allowed else 0
-        }
-
-        # Load existing bookings
-        wb = load_workbook(BOOKINGS_FILE)
-        ws = wb.active
-        current_count = {k: 0 for k in SHIFT_OPTIONS}
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            _, _, date_str, shift = row
-            if date_str == selected_date.strftime("%Y-%m-%d"):
-                current_count[shift] += 1
-
-        for shift in SHIFT_OPTIONS:
-            if current_count[shift] < shift_counts[shift]:
-                if shift == "Night" and not is_night_allowed:
-                    continue
-                if shift == "Night" and "Afternoon" in booked_today:
-                    continue
-                available_shifts.append(shift)
-
-        if not available_shifts:
-            bot.send_message(message.chat.id, "No available shifts for {selected_date}.")
+        _, kind, value = call.data.split(":", 2)
+        if kind == "p":
+            markup = date_picker_markup(tenant, student_id, datetime.strptime(value, "%Y-%m-%d").date())
+            bot.edit_message_text("Select a date to book:", call.message.chat.id, call.message.message_id, reply_markup=markup)
+        elif kind == "d":
+            handle_date_selection(call, tenant, student_id, datetime.strptime(value, "%Y-%m-%d").date())
+        elif kind == "s":
+            date_str, shift = value.split(":", 1)
+            selected_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+            # Answered first: during the rush the booking may wait in the queue longer than Telegram allows
+            bot.answer_callback_query(call.id)
+            finalize_booking(call, tenant, student_id, selected_date, shift)
             return
+    except ValueError:
+        bot.answer_callback_query(call.id, "Invalid selection. Please try /reserve again.")
+        return
+    bot.answer_callback_query(call.id)
+
+# handle date pick and show available shifts
+@profiled("handle_date_selection")
+def handle_date_selection(call, tenant, student_id, selected_date):
+    chat_id, message_id = call.message.chat.id, call.message.message_id
+    sg_now = datetime.now(SG_TZ)
 
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-        for shift in available_shifts:
-            markup.add(KeyboardButton(shift))
+    if not booking_window_open(tenant, selected_date, sg_now):
+        bot.edit_message_text(f"Booking for that month opens {tenant.rules['opening_days_before']} days before 1st of the month "
+                              f"at {tenant.rules['opening_hour']}:00 SG time.", chat_id, message_id)
+        return
 
-        bot.send_message(message.chat.id, "Select a shift:", reply_markup=markup)
-        bot.register_next_step_handler(message, finalize_booking, student_id, selected_date)
+    tenant.index.refresh(sg_now.date())
+    available_shifts = get_available_shifts(tenant, student_id, selected_date) if selected_date >= sg_now.date() else []
 
-    except ValueError:
-        bot.send_message(message.chat.id, "Invalid date format. Please try `/reserve` again.")
+    markup = InlineKeyboardMarkup(row_width=1)
+    for shift in available_shifts:
+        start, end = tenant.shift_options[shift]
+        markup.add(InlineKeyboardButton(f"{shift} ({start}–{end})", callback_data=f"rsv:s:{selected_date}:{shift}"))
+    markup.add(InlineKeyboardButton("‹ Back", callback_data=f"rsv:p:{selected_date}"))
+
+    if not available_shifts:
+        bot.edit_message_text(f"No available shifts for {selected_date}.", chat_id, message_id, reply_markup=markup)
+        return
+    bot.edit_message_text(f"Select a shift for {selected_date}:", chat_id, message_id, reply_markup=markup)
+
+# Capacity check and bookings write; returns a refusal message, or None once the booking is stored.
+# No Telegram calls in here: during the rush this runs on the tenant's admission queue.
+def reserve_slot(tenant, student_id, student_info, selected_date, chosen_shift):
+    name = student_info.name
+
+    # Serialises the capacity check and the write so two taps cannot take the last slot
+    with tenant.booking_lock:
+        sg_now = datetime.now(SG_TZ)
+        tenant.index.refresh(sg_now.date())
+        bookings = tenant.index.user_bookings(student_id)
+
+        # Prevent double booking same date and shift
+        ordinal = selected_date.toordinal()
+        for b in bookings:
+            if b.ordinal == ordinal and b.shift is Shift.parse(chosen_shift):
+                return f"You already booked {chosen_shift} shift on {selected_date}. Cannot book the same slot twice."
+
+        if selected_date < sg_now.date() or not booking_window_open(tenant, selected_date, sg_now) \
+                or chosen_shift not in get_available_shifts(tenant, student_id, selected_date):
+            return f"Sorry, {chosen_shift} on {selected_date} is no longer available. Use /reserve to pick another slot."
+
+        refusal = check_weekly_cap(tenant, student_info, bookings, selected_date, sg_now)
+        if refusal:
+            return refusal
+
+        # Save booking
+        version_before = tenant.store.data_version("bookings")
+        timestamp = sg_now.strftime("%Y-%m-%d %H:%M:%S")
+        tenant.store.append_row("bookings", [timestamp, student_info.student_id, name, selected_date.strftime("%Y-%m-%d"), chosen_shift])
+        tenant.index.apply_booking(Booking(ordinal, Shift.parse(chosen_shift), str(student_id), name, timestamp), version_before)
+    return None
 
 # Finalize booking and save to excel
-def finalize_booking(message, student_id, selected_date):
-    chosen_shift = message.text.strip()
-    if chosen_shift not in SHIFT_OPTIONS:
-        bot.send_message(message.chat.id, "Invalid shift.")
+@profiled("finalize_booking")
+def finalize_booking(call, tenant, student_id, selected_date, chosen_shift):
+    chat_id, message_id = call.message.chat.id, call.message.message_id
+    if chosen_shift not in tenant.shift_options:
+        bot.send_message(chat_id, "Invalid shift.")
         return
 
-    bookings = get_user_bookings(student_id)
-    student_info = get_student_info(student_id)
-    name = student_info[1]
+    student_info = get_student_info(tenant, student_id)
+    if student_info is None:
+        bot.edit_message_text(LOGIN_AGAIN, chat_id, message_id)
+        return
+    reserve = functools.partial(reserve_slot, tenant, student_id, student_info, selected_date, chosen_shift)
+    finish = functools.partial(finish_booking, tenant, chat_id, message_id, student_info, selected_date, chosen_shift)
+
+    if tenant.rush.active():
+        def on_queued(position):
+            bot.edit_message_text(f"High demand: you were #{position} in the queue for {chosen_shift} on {selected_date} "
+                                  f"when you tapped. Please wait...", chat_id, message_id)
+        queue_reservation(tenant, call.from_user.id, chat_id, reserve, finish, on_queued)
+    else:
+        finish(reserve())
 
-    # Prevent double booking same date and shift
-    for b in bookings:
-        if b['date'] == selected_date and b['shift'].lower() == chosen_shift.lower():
-            bot.send_message(message.chat.id, f"You already booked {chosen_shift} shift on {selected_date}. Cannot book the same slot twice.")
-            return
 
-    special_user = len(student_info) > 5 and student_info[5] == 1
+def finish_booking(tenant, chat_id, message_id, student_info, selected_date, chosen_shift, refusal):
+    if refusal:
+        bot.edit_message_text(refusal, chat_id, message_id)
+        return
 
-    week_start = selected_date - timedelta(days=selected_date.weekday())
-    week_end = week_start + timedelta(days=6)
-    SG = pytz.timezone("Asia/Singapore")
-    now = datetime.now(SG)
+    student_id, name = student_info.student_id, student_info.name
+    log_to_summary(tenant, "BOOKED", student_id, name, selected_date.strftime("%Y-%m-%d"), chosen_shift)
+    bot.edit_message_text(f"Booking confirmed for {selected_date} ({chosen_shift})!", chat_id, message_id)
+    send_manual(chat_id, tenant)
 
-    weekly_bookings = [b for b in bookings if week_start <= b["date"] <= week_end]
-    days_ahead = (selected_date - now.date()).days
-    within_5_days = days_ahead < 5
-    # Make selected_date into timezone-aware datetime
-    selected_datetime = SG.localize(datetime.combine(selected_date, datetime.min.time()))
-    within_48_hours = (selected_datetime - now).total_seconds() < 48 * 3600
+    # Notify groups
+    notify_group1(tenant, f"*Booked:* {name} ({student_id}) on {selected_date} [{chosen_shift}]")
 
-    if special_user:
-        if len(weekly_bookings) >= 2 and not within_48_hours:
-            bot.send_message(message.chat.id, "Max 2 shifts/week for your account (unless within 48h).")
-            return
-    else:
-        if len(weekly_bookings) >= 4 and not within_5_days:
-            bot.send_message(message.chat.id, "Max 4 shifts/week (unless within next 5 days).")
-            return
+    # If previously cancelled
+    if (selected_date.strftime("%Y-%m-%d"), chosen_shift) in tenant.cancelled_shifts:
+        notify_group2(tenant, f"Rebooked Cancelled Shift: {name} ({student_id}) on {selected_date} [{chosen_shift}]")
+        tenant.cancelled_shifts.discard((selected_date.strftime("%Y-%m-%d"), chosen_shift))
+
+
+def queue_reservation(tenant, user_key, chat_id, reserve, finish, on_queued):
+    """
+    Rush path: reserve() waits its turn in the tenant's admission queue and finish(result) follows it.
+    The chat is parked in the update dispatcher meanwhile instead of blocking its worker, and finish
+    runs back on the chat's worker, so the chat's later updates still come after the booking.
+    """
+    resume = update_dispatcher.hold()
+
+    def job():
+        try:
+            result = reserve()
+        except Exception:
+            if resume:
+                resume()
+            raise
+        followup = functools.partial(finish, result)
+        if resume:
+            resume(followup)
+        else:
+            followup()
 
-    # Save booking
-    wb = load_workbook(BOOKINGS_FILE)
-    ws = wb.active
-    timestamp = datetime.now(pytz.timezone("Asia/Singapore")).strftime("%Y-%m-%d %H:%M:%S")
-    ws.append([timestamp, student_info[0], name, selected_date.strftime("%Y-%m-%d"), chosen_shift])
-    wb.save(BOOKINGS_FILE)
+    position, accepted = tenant.rush.queue.submit(user_key, job)
+    if not accepted:
+        if resume:
+            resume()
+        bot.send_message(chat_id, "You already have a booking waiting in the queue.")
+        return
+    if position > 1:
+        on_queued(position)
 
-    log_to_summary("BOOKED", student_info[0], name, selected_date.strftime("%Y-%m-%d"), chosen_shift)
-    bot.send_message(message.chat.id, f"Booking confirmed for {selected_date} ({chosen_shift})!")
-    send_manual(message.chat.id)
 
-    # Notify groups
-    notify_group1(f"*Booked:* {name} ({student_id}) on {selected_date} [{chosen_shift}]")
+#---Recurring booking---
+# /recurring <shift> <weekday> <weeks>, e.g. "/recurring Morning Tue 8".
+# Every occurrence is checked in one pass and the accepted ones are written with one bookings
+# write and one summary write; dates that cannot be booked are reported back.
+MAX_RECURRING_WEEKS = 12
+RECURRING_USAGE = f"Usage: /recurring <shift> <weekday> <weeks>, e.g. /recurring Morning Tue 8 (max {MAX_RECURRING_WEEKS} weeks)."
 
-    # If previously cancelled
-    if (selected_date.strftime("%Y-%m-%d"), chosen_shift) in cancelled_shifts:
-        notify_group2(f"Rebooked Cancelled Shift: {name} ({student_id}) on {selected_date} [{chosen_shift}]")
-        cancelled_shifts.discard((selected_date.strftime("%Y-%m-%d"), chosen_shift))
+def parse_recurring_args(tenant, args):
+    """(shift, weekday, weeks) from the command arguments, or None if they do not parse."""
+    if len(args) != 3:
+        return None
+    shift = next((s for s in tenant.shift_options if s.lower() == args[0].lower()), None)
+    weekday = next((i for i, d in enumerate(WEEKDAY_NAMES) if args[1][:3].lower() == d.lower()), None)
+    if shift is None or weekday is None or not args[2].isdigit() or not 1 <= int(args[2]) <= MAX_RECURRING_WEEKS:
+        return None
+    return shift, weekday, int(args[2])
+
+def recurring_dates(weekday, weeks, today):
+    """The next `weeks` dates falling on weekday, starting today."""
+    first = today + timedelta(days=(weekday - today.weekday()) % 7)
+    return [first + timedelta(weeks=i) for i in range(weeks)]
+
+def plan_recurring(tenant, student_id, student_info, shift, dates, sg_now):
+    """Split dates into (accepted, [(date, reason)]) against the same rules as a single booking."""
+    bookings = tenant.index.user_bookings(student_id)
+    accepted, rejected = [], []
+    for day in dates:
+        ordinal = day.toordinal()
+        if any(b.ordinal == ordinal and b.shift.label == shift for b in bookings):
+            rejected.append((day, "already booked"))
+        elif not booking_window_open(tenant, day, sg_now):
+            rejected.append((day, "booking not open yet"))
+        elif shift not in get_available_shifts(tenant, student_id, day):
+            rejected.append((day, "full" if tenant.index.count(day, shift) >= tenant.shift_capacity(shift, day)
+                             else "not available to you"))
+        else:
+            refusal = check_weekly_cap(tenant, student_info, bookings, day, sg_now)
+            if refusal:
+                rejected.append((day, "weekly cap reached"))
+                continue
+            booking = Booking(ordinal, Shift.parse(shift), student_info.student_id, student_info.name, None)
+            accepted.append(booking)
+            bookings.append(booking)  # later occurrences count it towards the weekly cap
+    return accepted, rejected
+
+@bot.message_handler(commands=['recurring'])
+@profiled("recurring_handler")
+def recurring_handler(message):
+    student_id = get_student_id_from_session(message.from_user.id)
+    if not student_id:
+        bot.send_message(message.chat.id, "You are not logged in. Use /start.")
+        return
+    tenant = get_tenant_from_session(message.from_user.id)
+
+    parsed = parse_recurring_args(tenant, message.text.split()[1:])
+    if parsed is None:
+        bot.send_message(message.chat.id, RECURRING_USAGE + "\nShifts: " + ", ".join(tenant.shift_options))
+        return
+
+    book_recurring(message, tenant, student_id, *parsed)
+
+# Checks and writes the series; returns (accepted, rejected). No Telegram calls (may run on the admission queue).
+def reserve_recurring(tenant, student_id, student_info, shift, weekday, weeks):
+    name = student_info.name
+    with tenant.booking_lock:
+        sg_now = datetime.now(SG_TZ)
+        tenant.index.refresh(sg_now.date())
+        dates = recurring_dates(weekday, weeks, sg_now.date())
+        accepted, rejected = plan_recurring(tenant, student_id, student_info, shift, dates, sg_now)
+
+        # One write for the whole series
+        if accepted:
+            version_before = tenant.store.data_version("bookings")
+            timestamp = sg_now.strftime("%Y-%m-%d %H:%M:%S")
+            tenant.store.append_rows("bookings", [[timestamp, student_info.student_id, name, b.date_str, shift] for b in accepted])
+            for b in accepted:
+                b.timestamp = timestamp
+            tenant.index.apply_bookings(accepted, version_before)
+    return accepted, rejected
+
+def book_recurring(message, tenant, student_id, shift, weekday, weeks):
+    chat_id = message.chat.id
+    student_info = get_student_info(tenant, student_id)
+    if student_info is None:
+        bot.send_message(chat_id, LOGIN_AGAIN)
+        return
+    reserve = functools.partial(reserve_recurring, tenant, student_id, student_info, shift, weekday, weeks)
+    finish = functools.partial(finish_recurring, tenant, chat_id, student_info, shift, weekday, weeks)
+
+    if tenant.rush.active():
+        # Same as finalize_booking: only the checks and the write wait in the queue
+        def on_queued(position):
+            bot.send_message(chat_id, f"High demand: you were #{position} in the queue when you sent this. Please wait...")
+        queue_reservation(tenant, message.from_user.id, chat_id, reserve, finish, on_queued)
+    else:
+        finish(reserve())
+
+
+def finish_recurring(tenant, chat_id, student_info, shift, weekday, weeks, result):
+    accepted, rejected = result
+    student_id, name = student_info.student_id, student_info.name
+    lines = [f"Recurring {shift} on {WEEKDAY_NAMES[weekday]}, {weeks} week(s):"]
+    if accepted:
+        log_many_to_summary(tenant, "BOOKED", student_id, name, [(b.date_str, shift) for b in accepted])
+        lines.append(f"Booked {len(accepted)}:")
+        lines += [f"• {b.date_str}" for b in accepted]
+    if rejected:
+        lines.append(f"Not booked {len(rejected)}:")
+        lines += [f"• {day} – {reason}" for day, reason in rejected]
+    bot.send_message(chat_id, "\n".join(lines))
+    if not accepted:
+        return
+
+    # One group message for the series; rebooked cancellations are still flagged individually
+    notify_group1(tenant, f"*Booked ({len(accepted)}x recurring):* {name} ({student_id}) [{shift}] on "
+                          + ", ".join(b.date_str for b in accepted))
+    rebooked = [b.date_str for b in accepted if (b.date_str, shift) in tenant.cancelled_shifts]
+    if rebooked:
+        notify_group2(tenant, f"Rebooked Cancelled Shift: {name} ({student_id}) on {', '.join(rebooked)} [{shift}]")
+        for date_str in rebooked:
+            tenant.cancelled_shifts.discard((date_str, shift))
 
 
 # Cancel booked shift
@@ -321,62 +690,62 @@ def cancel_handler(message):
         return
 
     student_id = get_student_id_from_session(message.from_user.id)
-    bookings = get_user_bookings(student_id)
-    future = [b for b in bookings if b["date"] >= datetime.today().date()]
+    tenant = get_tenant_from_session(message.from_user.id)
+    bookings = get_user_bookings(tenant, student_id)
+    today = datetime.now(SG_TZ).date().toordinal()
+    future = [b for b in bookings if b.ordinal >= today]
 
     if not future:
         bot.send_message(message.chat.id, "No future bookings to cancel.")
         return
 
     markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    options = {}
     for b in future:
-        label = f"{b['date']} - {b['shift']}"
-        markup.add(KeyboardButton(label))
-        options[label] = b
+        markup.add(KeyboardButton(b.label))
 
     bot.send_message(message.chat.id, "Select booking to cancel:", reply_markup=markup)
-    bot.register_next_step_handler_by_chat_id(message.chat.id, confirm_cancel, student_id, options)
+    conversations.set(message.chat.id, "cancel", student_id=student_id, tenant=tenant.key)
 
-def confirm_cancel(message, student_id, booking_map):
+@profiled("confirm_cancel")
+def confirm_cancel(message, student_id, tenant=None):
+    tenant = get_tenant(tenant)
     selected = message.text.strip()
+    # Re-derive the choices instead of carrying them in the dialog state
+    booking_map = {b.label: b for b in get_user_bookings(tenant, student_id)}
     if selected not in booking_map:
         bot.send_message(message.chat.id, "Invalid selection.")
         return
 
     b = booking_map[selected]
-    date_str = b['date'].strftime("%Y-%m-%d")
-    shift = b['shift']
-    student = get_student_info(student_id)
-    name = student[1]
-
-    # Delete from bookings.xlsx
-    wb = load_workbook(BOOKINGS_FILE)
-    ws = wb.active
-    for row in ws.iter_rows(min_row=2):
-        if (str(row[0].value) == student_id and row[2].value == date_str and row[3].value == shift):
-            ws.delete_rows(row[0].row)
-            break
-    wb.save(BOOKINGS_FILE)
-
-    # Append to cancellations.xlsx
-    log_wb = load_workbook(CANCELLATIONS_FILE) if os.path.exists(CANCELLATIONS_FILE) else Workbook()
-    log_ws = log_wb.active
-    if log_ws.max_row == 1:
-        log_ws.append(["Timestamp", "StudentID", "Name", "Date", "Shift", "LIC", "LIC Verified"])
-    log_ws.append([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), student_id, name, date_str, shift, "N/A", "N/A"])
-    log_wb.save(CANCELLATIONS_FILE)
+    date_str = b.date_str
+    shift = b.shift.label
+    student = get_student_info(tenant, student_id)
+    if student is None:
+        bot.send_message(message.chat.id, LOGIN_AGAIN)
+        return
+    name = student.name
+
+    # Delete from the booking's month partition, then drop it from the in-memory rosters
+    version_before = tenant.store.data_version("bookings")
+    if tenant.store.delete_first("bookings", b.date,
+                                 lambda r: student_key(r["student_id"]) == student_id
+                                 and storage.day_key(r["date"]) == date_str and Shift.parse(r["shift"]) is b.shift):
+        tenant.index.apply_cancellation(b, version_before)
+
+    # Append to the cancellations partition
+    tenant.store.append_row("cancellations", [datetime.now(SG_TZ).strftime("%Y-%m-%d %H:%M:%S"), student_id, name, date_str, shift, "N/A", "N/A"])
 
     # Add to cancelled_shifts set
-    cancelled_shifts.add((date_str, shift))
-    log_to_summary("CANCELLED", student_id, name, date_str, shift)
+    tenant.cancelled_shifts.add((date_str, shift))
+    log_to_summary(tenant, "CANCELLED", student_id, name, date_str, shift)
 
     bot.send_message(message.chat.id, f"Booking on {date_str} ({shift}) cancelled.")
-    send_manual(message.chat.id)
+    send_manual(message.chat.id, tenant)
 
-    # Notify groups
-    notify_group1(f"Cancelled: {name} ({student_id}) on {date_str} [{shift}]")
-    notify_group2(f"Shift Cancelled: {name} ({student_id}) on {date_str} [{shift}]")
+    # Notify groups; same-day cancellations skip the digest so the slot can be filled in time
+    same_day = b.date == datetime.now(SG_TZ).date()
+    notify_group1(tenant, f"Cancelled: {name} ({student_id}) on {date_str} [{shift}]", urgent=same_day)
+    notify_group2(tenant, f"Shift Cancelled: {name} ({student_id}) on {date_str} [{shift}]", urgent=same_day)
 
 
 #  User booked summary
@@ -387,126 +756,467 @@ def my_bookings_handler(message):
         return
 
     student_id = get_student_id_from_session(message.from_user.id)
-    all_bookings = get_user_bookings(student_id)
+    tenant = get_tenant_from_session(message.from_user.id)
+    all_bookings = get_user_bookings(tenant, student_id)
 
     if not all_bookings:
         bot.send_message(message.chat.id, "You have no bookings.")
         return
 
-    today = datetime.now(pytz.timezone("Asia/Singapore")).date()
+    today = datetime.now(SG_TZ).date()
 
     # Filter for today and future dates
-    future_bookings = [b for b in all_bookings if b['date'] >= today]
+    future_bookings = [b for b in all_bookings if b.ordinal >= today.toordinal()]
 
     if not future_bookings:
         bot.send_message(message.chat.id, "You have no upcoming bookings.")
         return
 
     # Sort by date
-    sorted_bookings = sorted(future_bookings, key=lambda x: x['date'])
+    sorted_bookings = sorted(future_bookings, key=lambda x: (x.ordinal, x.shift))
 
     message_lines = ["Your Upcoming Shifts:"]
     for b in sorted_bookings:
         shift_time = ""
-        if b['shift'].lower() == "morning":
-            shift_time = "(9AM–12PM)"
-        elif b['shift'].lower() == "afternoon":
-            shift_time = "(2PM–6PM)"
-        elif b['shift'].lower() == "night":
-            shift_time = "(6PM–10PM)"
+        if b.shift.label in tenant.shift_options:
+            shift_time = "({}–{})".format(*tenant.shift_options[b.shift.label])
         else:
             shift_time = ""  # fallback in case of invalid entry
 
-        message_lines.append(f"• {b['date']} - {b['shift'].capitalize()} {shift_time}")
+        message_lines.append(f"• {b.date_str} - {b.shift.label} {shift_time}")
 
     response = "\n".join(message_lines)
     bot.send_message(message.chat.id, response)
 
 
+# === Rosters and LIC verification ===
+# /roster [date] shows who is on each shift; /verify [date] lets the shift lead (LIC) mark attendance.
+# Results go to the summary log as VERIFIED events with the LIC and LIC Verified columns filled (see roster.py).
+VERIFY_MARKS = {"p": PRESENT, "a": ABSENT}
+
+def get_roster_user(message_or_call):
+    """(tenant, Student) of a logged-in admin or LIC, or None."""
+    tenant, student = get_session_student(message_or_call.from_user.id)
+    if student is not None and (student.is_admin or student.is_lic):
+        return tenant, student
+    return None
+
+def parse_roster_date(message, today):
+    args = message.text.split()[1:]
+    if not args:
+        return today
+    try:
+        return datetime.strptime(args[0], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def format_roster(tenant, day, today):
+    verified = tenant.roster.verifications(day)
+    lines = [f"Roster {day.isoformat()} ({WEEKDAY_NAMES[day.weekday()]})"]
+    for shift_name, (start, end) in tenant.shift_options.items():
+        bookings = tenant.roster.bookings(day, shift_name, today)
+        capacity = tenant.shift_capacity(shift_name, day)
+        if not capacity and not bookings:
+            continue
+        lines.append(f"\n{shift_name} ({start}–{end}) {len(bookings)}/{capacity}")
+        for b in bookings:
+            lic, status = verified.get((b.shift, b.student_id), (None, None))
+            mark = f" – {status}, verified by {lic}" if status else ""
+            lines.append(f"• {b.name} ({b.student_id}){mark}")
+    if len(lines) == 1:
+        lines.append("No shifts.")
+    return "\n".join(lines)
+
+def verify_markup(tenant, day, today):
+    verified = tenant.roster.verifications(day)
+    markup = InlineKeyboardMarkup()
+    for shift_name in tenant.shift_options:
+        for b in tenant.roster.bookings(day, shift_name, today):
+            status = verified.get((b.shift, b.student_id), (None, None))[1]
+            prefix = f"lic:{day.isoformat()}:{int(b.shift)}:{b.student_id}"
+            markup.row(
+                InlineKeyboardButton(f"{'✅ ' if status == PRESENT else ''}{b.name} {shift_name}", callback_data=f"{prefix}:p"),
+                InlineKeyboardButton(f"{'❌ ' if status == ABSENT else ''}Absent", callback_data=f"{prefix}:a"),
+            )
+    return markup
+
+@bot.message_handler(commands=['roster'])
+def roster_handler(message):
+    user = get_roster_user(message)
+    if not user:
+        bot.send_message(message.chat.id, "Unauthorized.")
+        return
+    tenant, _ = user
+    today = datetime.now(SG_TZ).date()
+    day = parse_roster_date(message, today)
+    if day is None:
+        bot.send_message(message.chat.id, "Usage: /roster [YYYY-MM-DD]")
+        return
+    bot.send_message(message.chat.id, format_roster(tenant, day, today))
+
+@bot.message_handler(commands=['verify'])
+def verify_handler(message):
+    user = get_roster_user(message)
+    if not user:
+        bot.send_message(message.chat.id, "Unauthorized.")
+        return
+    tenant, _ = user
+    today = datetime.now(SG_TZ).date()
+    day = parse_roster_date(message, today)
+    if day is None:
+        bot.send_message(message.chat.id, "Usage: /verify [YYYY-MM-DD]")
+        return
+    if day > today:
+        bot.send_message(message.chat.id, "Attendance can only be verified on or after the shift date.")
+        return
+    markup = verify_markup(tenant, day, today)
+    if not markup.inline_keyboard:
+        bot.send_message(message.chat.id, f"No bookings on {day.isoformat()}.")
+        return
+    bot.send_message(message.chat.id, f"Attendance {day.isoformat()}: tap a name for Present, or Absent.",
+                     reply_markup=markup)
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("lic:"))
+def verify_callback(call):
+    user = get_roster_user(call)
+    if not user:
+        bot.answer_callback_query(call.id, "Unauthorized.")
+        return
+    tenant, lic = user
+    _, date_str, shift, student_id, mark = call.data.split(":")
+    day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    today = datetime.now(SG_TZ).date()
+    booking = next((b for b in tenant.roster.bookings(day, Shift(int(shift)), today) if b.student_id == student_id), None)
+    if booking is None or mark not in VERIFY_MARKS:
+        bot.answer_callback_query(call.id, "Booking no longer exists.")
+        return
+    timestamp = datetime.now(SG_TZ).strftime("%Y-%m-%d %H:%M:%S")
+    tenant.roster.verify(booking, f"{lic.name} ({lic.student_id})", VERIFY_MARKS[mark], timestamp)
+    bot.answer_callback_query(call.id, f"{booking.name}: {VERIFY_MARKS[mark]}")
+    bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id,
+                                  reply_markup=verify_markup(tenant, day, today))
+
+
+# === Background admin jobs ===
+# Exports and cold stats run on a small worker pool (see jobs.py); the admin gets a progress
+# message that is edited in place and carries a Cancel button until the job finishes.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "20"))
+
+def show_job_progress(job):
+    text = job.describe()
+    if text == job.shown:
+        return
+    markup = None
+    if job.status not in FINISHED:
+        markup = InlineKeyboardMarkup()
+        markup.add(InlineKeyboardButton("Cancel", callback_data=f"job:cancel:{job.id}"))
+    if job.message_id is None:
+        job.message_id = bot.send_message(job.chat_id, text, reply_markup=markup).message_id
+    else:
+        bot.edit_message_text(text, job.chat_id, job.message_id, reply_markup=markup)
+    job.shown = text
+
+admin_jobs = JobQueue(show_job_progress, workers=JOB_WORKERS, max_pending=JOB_QUEUE_MAX)
+
+def submit_admin_job(message, name, func):
+    try:
+        admin_jobs.submit(name, message.from_user.id, message.chat.id, func)
+    except QueueFull:
+        bot.send_message(message.chat.id, "Too many jobs are waiting. Please try again in a few minutes.")
+
 # Only allow admin to access to summary log
+# /summary_log [delta] [csv]: delta sends only the summary events added since this admin's previous export
+SUMMARY_LOG_USAGE = "Usage: /summary_log [delta] [csv]"
+
 @bot.message_handler(commands=['summary_log'])
+@profiled("summary_log_handler")
 def summary_log_handler(message):
-    user = logged_in_users.get(message.from_user.id)
-    if not user or not user.get("is_admin"):
+    user = get_admin_user(message)
+    if not user:
         bot.send_message(message.chat.id, "Unauthorized.")
         return
+    tenant, admin = user
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-        summary_path = tmp.name
+    args = [a.lower() for a in message.text.split()[1:]]
+    if any(a != "delta" and a not in exports.FORMATS for a in args):
+        bot.send_message(message.chat.id, SUMMARY_LOG_USAGE)
+        return
+    fmt = "csv" if "csv" in args else "xlsx"
+    delta = "delta" in args
+    submit_admin_job(message, f"{'delta' if delta else 'full'} {fmt} export",
+                     lambda job: export_summary(job, tenant, admin.student_id, delta, fmt))
+
+@profiled("export_summary")
+def export_summary(job, tenant, admin_id, delta, fmt):
+    now = datetime.now(SG_TZ)
+    at = now.strftime("%Y-%m-%d %H:%M:%S")
+
+    if delta:
+        previous = tenant.export_cursors.get(admin_id)
+        job.progress("reading summary log")
+        rows, cursor = exports.summary_since(tenant.store, previous, at)
+        if not rows:
+            return f"no changes since {previous['at']}" if previous else "no changes to export"
+        sheets = exports.delta_sheets(rows)
+        name = f"ShiftSummary-delta-{now.strftime('%Y%m%d-%H%M')}"
+        caption = f"{len(rows)} change(s) since {previous['at']}" if previous else f"{len(rows)} change(s) (first export)"
+    else:
+        # Taken before reading, so events written during the export show up in the next delta
+        cursor = exports.end_cursor(tenant.store, at)
+        sheets = [(title, headers, job.track(rows, title)) for title, headers, rows in exports.full_sheets(tenant.store)]
+        name = "ShiftSummary"
+        caption = None
 
-    wb = Workbook()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = exports.WRITERS[fmt](os.path.join(tmp_dir, f"{name}.{fmt}"), sheets)
+        job.progress("uploading", force=True)
+        for path in paths:
+            # Send as Telegram document
+            with open(path, "rb") as f:
+                bot.send_document(job.chat_id, InputFile(f, file_name=os.path.basename(path)), caption=caption)
+    finally:
+        # Cleanup temp files
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # The cursor only moves once the admin has the file
+    tenant.export_cursors.set(admin_id, cursor)
+    return "sent " + ", ".join(os.path.basename(p) for p in paths)
+
+# Admin utilization stats (cached, see stats.py); a cold report is built in the background
+@bot.message_handler(commands=['stats'])
+def stats_handler(message):
+    user = get_admin_user(message)
+    if not user:
+        bot.send_message(message.chat.id, "Unauthorized.")
+        return
+    tenant, _ = user
 
-    # ------------------ Bookings Sheet ------------------
-    if os.path.exists(BOOKINGS_FILE):
-        booking_ws = load_workbook(BOOKINGS_FILE).active
-        main_sheet = wb.active
-        main_sheet.title = "Bookings"
-        for row in booking_ws.iter_rows(values_only=True):
-            main_sheet.append(row)
-    else:
-        wb.active.append(["No bookings found."])
+    report = stats.cached_report(tenant)
+    if report is not None:
+        bot.send_message(message.chat.id, report)
+        return
+
+    def build(job):
+        job.progress("aggregating partitions")
+        bot.send_message(job.chat_id, stats.get_report(tenant))
+        return "report sent"
+    submit_admin_job(message, "stats", build)
+
+# /jobs lists your recent background jobs, /cancel_job <id> stops one
+@bot.message_handler(commands=['jobs'])
+def jobs_handler(message):
+    if not get_admin_user(message):
+        bot.send_message(message.chat.id, "Unauthorized.")
+        return
+    mine = admin_jobs.list(owner=message.from_user.id)[-10:]
+    if not mine:
+        bot.send_message(message.chat.id, "No background jobs.")
+        return
+    bot.send_message(message.chat.id, "\n".join(job.describe() for job in mine))
 
-    # ------------------ Cancellations Sheet ------------------
-    if os.path.exists(CANCELLATIONS_FILE):
-        cancel_ws = load_workbook(CANCELLATIONS_FILE).active
-        sheet = wb.create_sheet("Cancellations")
-        for row in cancel_ws.iter_rows(values_only=True):
-            sheet.append(row)
+@bot.message_handler(commands=['cancel_job'])
+def cancel_job_handler(message):
+    args = message.text.split()[1:]
+    if not args or not args[0].lstrip("#").isdigit():
+        bot.send_message(message.chat.id, "Usage: /cancel_job <id>")
+        return
+    job = admin_jobs.cancel(int(args[0].lstrip("#")), owner=message.from_user.id)
+    bot.send_message(message.chat.id, f"Cancelling job #{job.id}." if job else "No such running job.")
 
-    # Save final summary Excel file
-    wb.save(summary_path)
+@bot.callback_query_handler(func=lambda call: call.data.startswith("job:cancel:"))
+def cancel_job_callback(call):
+    job = admin_jobs.cancel(int(call.data.rsplit(":", 1)[1]), owner=call.from_user.id)
+    bot.answer_callback_query(call.id, "Cancelling..." if job else "Job already finished.")
 
-    # Send as Telegram document
-    with open(summary_path, "rb") as f:
-        bot.send_document(message.chat.id, InputFile(f, filename="ShiftSummary.xlsx"))
+# Admin profiling switch: /profile toggles sampling, /profile top shows hotspots (see profiling.py)
+PROFILE_USAGE = "Usage: /profile [rate], rate being the share of handler calls to sample, 0 < rate <= 1 (e.g. 0.2); /profile top"
 
-    # Cleanup temp file
-    os.remove(summary_path)
+@bot.message_handler(commands=['profile'])
+def profile_handler(message):
+    if not get_admin_user(message):
+        bot.send_message(message.chat.id, "Unauthorized.")
+        return
+
+    args = message.text.split()[1:]
+    if args and args[0] == "top":
+        bot.send_message(message.chat.id, profiling.top_hotspots()[:4000])
+        return
+
+    rate = None
+    if args:
+        try:
+            rate = float(args[0])
+        except ValueError:
+            rate = 0.0
+        if not 0 < rate <= 1:
+            bot.send_message(message.chat.id, PROFILE_USAGE)
+            return
+
+    if profiling.state["enabled"]:
+        profiling.disable()
+        bot.send_message(message.chat.id, "Profiling off.\n\n" + profiling.top_hotspots()[:3900])
+    else:
+        profiling.enable(rate)
+        bot.send_message(message.chat.id, f"Profiling on (sampling {profiling.state['sample_rate']:.0%} of handler calls). "
+                                          f"Send /profile again to stop and see hotspots.")
 
 # Auto notification of the upcoming shift one hour in advance
+REMINDER_INTERVAL = 60
+
 def shift_reminder_loop():
     while True:
-        now = datetime.now(pytz.timezone("Asia/Singapore"))
-        today = now.date()
-
-        # Load today's bookings
-        if not os.path.exists(BOOKINGS_FILE):
-            time.sleep(60)
-            continue
-
-        wb = load_workbook(BOOKINGS_FILE)
-        ws = wb.active
-
-        for shift_name, (start_str, _) in SHIFT_OPTIONS.items():
-            shift_start_time = datetime.strptime(start_str, "%H:%M").time()
-            shift_datetime = datetime.combine(today, shift_start_time)
-            shift_datetime = pytz.timezone("Asia/Singapore").localize(shift_datetime)
-
-            # Notify exactly 1 hour before the shift
-            time_diff = (shift_datetime - now).total_seconds()
-            if 3540 <= time_diff <= 3660:  # ~1 hour ±1 minute window
-                students_in_shift = [
-                    (row[0], row[1]) for row in ws.iter_rows(min_row=2, values_only=True)
-                    if row[2] == today.strftime("%Y-%m-%d") and row[3] == shift_name
-                ]
-
-                if students_in_shift:
-                    msg_lines = [f"*Shift Reminder: {shift_name} ({start_str})*", f"*Date:* {today.strftime('%Y-%m-%d')}"]
-                    for sid, name in students_in_shift:
-                        msg_lines.append(f"{name} (ID: {sid})")
-                    message = "\n".join(msg_lines)
-
-                    # Notify all logged-in users in the shift
-                    for user_id, info in logged_in_users.items():
-                        if (info["student_id"], info["name"]) in students_in_shift:
-                            bot.send_message(user_id, message)
+        try:
+            run_scheduled_jobs(datetime.now(SG_TZ))
+            health.mark("scheduler_run")
+        except Exception:
+            telebot.logger.exception("Scheduled jobs failed")
 
         # Sleep 60 seconds before next check
-        time.sleep(60)
+        time.sleep(REMINDER_INTERVAL)
+
+@profiled("shift_reminder_loop")
+def run_scheduled_jobs(now):
+    # Drop abandoned /start and /cancel dialogs and expired logins
+    conversations.purge()
+    logged_in_users.purge()
+    for tenant in TENANTS.values():
+        run_tenant_jobs(tenant, now)
+
+def run_tenant_jobs(tenant, now):
+    today = now.date()
+
+    # Rotate last month's partitions into the archive once the month turns
+    tenant.store.rotate_archive(today)
+    # Pre-warm caches when a booking window is about to open
+    tenant.rush.tick(now)
+    # Rebuild the availability index if an interleaved write left it stale, so it is warm before the next tap
+    tenant.index.refresh(today)
+
+    for shift_name, (start_str, _) in tenant.shift_options.items():
+        shift_start_time = datetime.strptime(start_str, "%H:%M").time()
+        shift_datetime = datetime.combine(today, shift_start_time)
+        shift_datetime = SG_TZ.localize(shift_datetime)
+
+        # Notify exactly 1 hour before the shift
+        time_diff = (shift_datetime - now).total_seconds()
+        if 3540 <= time_diff <= 3660:  # ~1 hour ±1 minute window
+            # Today's roster is kept in memory by the availability index (see roster.py)
+            students_in_shift = [(b.student_id, b.name) for b in tenant.roster.bookings(today, shift_name, today)]
+
+            if students_in_shift:
+                msg_lines = [f"*Shift Reminder: {shift_name} ({start_str})*", f"*Date:* {today.strftime('%Y-%m-%d')}"]
+                for sid, name in students_in_shift:
+                    msg_lines.append(f"{name} (ID: {sid})")
+                message = "\n".join(msg_lines)
+                on_shift = {sid for sid, _ in students_in_shift}
+
+                # Notify all logged-in users in the shift
+                for user_id, info in logged_in_users.items():
+                    if get_tenant(info.get("tenant")) is tenant and info["student_id"] in on_shift:
+                        bot.send_message(user_id, message)
+
+# === Pending dialog dispatch ===
+# Registered last so commands always win over a pending step
+CONVERSATION_STEPS = {
+    "student_id": get_student_id,
+    "student_name": get_student_name,
+    "cancel": confirm_cancel,
+}
+
+@bot.message_handler(func=lambda m: not (m.text or "").startswith("/") and conversations.get(m.chat.id) is not None,
+                     content_types=['text'])
+def conversation_step_handler(message):
+    pending = conversations.pop(message.chat.id)
+    if pending is None:
+        return
+    step, data = pending
+    CONVERSATION_STEPS[step](message, **data)
+
+# === Health checks (served on /healthz and /readyz by keep_alive.py) ===
+HEALTH_MAX_POLL_AGE = float(os.getenv("HEALTH_MAX_POLL_AGE", "120"))
+HEALTH_MAX_UPDATE_AGE = float(os.getenv("HEALTH_MAX_UPDATE_AGE", "0"))  # 0: report only, quiet hours are normal
+HEALTH_MAX_SCHEDULER_LAG = float(os.getenv("HEALTH_MAX_SCHEDULER_LAG", "120"))
+HEALTH_MAX_STORAGE_MS = float(os.getenv("HEALTH_MAX_STORAGE_MS", "2000"))
+HEALTH_MAX_OUTBOUND_QUEUE = int(os.getenv("HEALTH_MAX_OUTBOUND_QUEUE", "200"))
+HEALTH_MAX_UPDATE_WAIT_MS = float(os.getenv("HEALTH_MAX_UPDATE_WAIT_MS", "5000"))
+# A stuck worker shows up in the updates still waiting, not in the waits of completed ones
+HEALTH_MAX_UPDATE_PENDING_S = float(os.getenv("HEALTH_MAX_UPDATE_PENDING_S", "30"))
+HEALTH_MAX_UPDATE_BACKLOG = int(os.getenv("HEALTH_MAX_UPDATE_BACKLOG", "500"))
+
+def track_bot_activity(bot):
+    """Record every getUpdates round trip for the health checks (processed updates: see process_updates)."""
+    get_updates = bot.get_updates
+
+    def tracked_get_updates(*args, **kwargs):
+        updates = get_updates(*args, **kwargs)
+        health.mark("last_poll")
+        return updates
+
+    bot.get_updates = tracked_get_updates
+
+def _seconds(value):
+    return None if value is None else round(value, 1)
+
+def check_polling():
+    poll_age = health.age("last_poll")
+    return poll_age is not None and poll_age <= HEALTH_MAX_POLL_AGE, _seconds(poll_age)
+
+def check_last_update():
+    update_age = health.age("last_update")
+    ok = not HEALTH_MAX_UPDATE_AGE or (update_age is not None and update_age <= HEALTH_MAX_UPDATE_AGE)
+    return ok, _seconds(update_age)
+
+def check_scheduler():
+    run_age = health.age("scheduler_run")
+    if run_age is None:
+        return False, None
+    lag = max(0.0, run_age - REMINDER_INTERVAL)
+    return lag <= HEALTH_MAX_SCHEDULER_LAG, _seconds(lag)
+
+def check_storage():
+    timings = {key: tenant.store.probe() for key, tenant in TENANTS.items()}
+    return all(max(t.values()) <= HEALTH_MAX_STORAGE_MS for t in timings.values()), timings
+
+def check_outbound_queue():
+    depth = {"digest": digest.pending_count(), "rush_queue": sum(len(t.rush.queue) for t in TENANTS.values()),
+             "admin_jobs": admin_jobs.pending()}
+    return sum(depth.values()) <= HEALTH_MAX_OUTBOUND_QUEUE, depth
+
+def check_update_dispatch():
+    dispatch_stats = update_dispatcher.stats()
+    wait, oldest = dispatch_stats["wait_p90_ms"], dispatch_stats["oldest_pending_s"]
+    ok = (wait is None or wait <= HEALTH_MAX_UPDATE_WAIT_MS) \
+        and (oldest is None or oldest <= HEALTH_MAX_UPDATE_PENDING_S) \
+        and dispatch_stats["pending"] <= HEALTH_MAX_UPDATE_BACKLOG
+    return ok, dispatch_stats
+
+def check_cache_warmth():
+    # index.version goes back to None whenever a write falls back to "rebuild on next refresh";
+    # that is still a built index, so warmth only asks whether it was ever built
+    warm = {key: {"availability_index": tenant.index.start is not None, "students": tenant.students_loaded}
+            for key, tenant in TENANTS.items()}
+    return all(all(w.values()) for w in warm.values()), warm
+
+health.monitor.register("polling_age_s", check_polling)
+health.monitor.register("last_update_age_s", check_last_update)
+health.monitor.register("scheduler_lag_s", check_scheduler)
+health.monitor.register("storage_probe_ms", check_storage, ready_only=True)
+health.monitor.register("outbound_queue", check_outbound_queue, ready_only=True)
+health.monitor.register("cache_warm", check_cache_warmth, ready_only=True)
+health.monitor.register("update_dispatch", check_update_dispatch, ready_only=True)
 
 # Run 24/7
 from keep_alive import keep_alive
 if __name__ == "__main__":
+    track_bot_activity(bot)
+    # Warm caches before accepting traffic so /readyz turns green
+    for _tenant in TENANTS.values():
+        get_student_info(_tenant, None)
+        _tenant.index.refresh(datetime.now(SG_TZ).date())
+    health.mark("last_poll")
     keep_alive()
+    threading.Thread(target=shift_reminder_loop, daemon=True).start()
     print("Bot is running.")
     bot.polling(non_stop=True)
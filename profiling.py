@@ -0,0 +1,125 @@
+# profiling.py
+# Opt-in handler profiling (sampled cProfile + tracemalloc) and slow-call logging.
+import io
+import os
+import glob
+import time
+import random
+import pstats
+import cProfile
+import logging
+import functools
+import threading
+import tracemalloc
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# PROFILE_HANDLERS=1 turns sampling on at startup; /profile toggles it at runtime
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+SLOW_CALL_MS = float(os.getenv("SLOW_CALL_MS", "2000"))
+
+state = {
+    "enabled": False,
+    "sample_rate": float(os.getenv("PROFILE_SAMPLE_RATE", "0.2")),
+}
+
+# cProfile allows one active profiler at a time, so samples never overlap
+_profile_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable(sample_rate=None):
+    if sample_rate is not None:
+        state["sample_rate"] = sample_rate
+    state["enabled"] = True
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    state["enabled"] = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _rotate():
+    files = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.prof")), key=os.path.getmtime)
+    for old in files[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else files:
+        os.remove(old)
+        mem = old[:-len(".prof")] + ".mem.txt"
+        if os.path.exists(mem):
+            os.remove(mem)
+
+
+def _write_sample(name, profiler, mem_before, mem_after, elapsed):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}")
+    profiler.dump_stats(stem + ".prof")
+    if mem_before is not None and mem_after is not None:
+        with open(stem + ".mem.txt", "w", encoding="utf-8") as f:
+            f.write(f"{name}: {elapsed * 1000:.1f}ms\n")
+            for stat in mem_after.compare_to(mem_before, "lineno")[:15]:
+                f.write(f"{stat}\n")
+    _rotate()
+
+
+def profiled(name):
+    """Time every call (logging slow ones) and, when profiling is on, sample it into PROFILE_DIR."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            sample = (
+                state["enabled"]
+                and not getattr(_local, "active", False)
+                and random.random() < state["sample_rate"]
+                and _profile_lock.acquire(blocking=False)
+            )
+            profiler = mem_before = None
+            if sample:
+                _local.active = True
+                profiler = cProfile.Profile()
+                mem_before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+                profiler.enable()
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                if sample:
+                    profiler.disable()
+                    mem_after = tracemalloc.take_snapshot() if mem_before is not None and tracemalloc.is_tracing() else None
+                    _local.active = False
+                    _profile_lock.release()
+                    try:
+                        _write_sample(name, profiler, mem_before, mem_after, elapsed)
+                    except OSError:
+                        logger.exception("Could not write profile for %s", name)
+                if SLOW_CALL_MS and elapsed * 1000 >= SLOW_CALL_MS:
+                    logger.warning("Slow call: %s took %.0fms", name, elapsed * 1000)
+        return wrapper
+    return decorator
+
+
+def top_hotspots(limit=15):
+    """Cumulative-time hotspots across the retained samples, as text."""
+    files = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.prof")), key=os.path.getmtime)
+    if not files:
+        return "No profile samples yet."
+    stats = pstats.Stats(files[0], stream=io.StringIO())
+    for path in files[1:]:
+        stats.add(path)
+    stats.sort_stats("cumulative")
+
+    lines = [f"Hotspots over {len(files)} samples (cumulative time):"]
+    width = len(os.getcwd()) + 1
+    for func, (cc, nc, tt, ct, callers) in sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:limit]:
+        filename, line, fname = func
+        filename = filename[width:] if filename.startswith(os.getcwd()) else os.path.basename(filename)
+        lines.append(f"{ct * 1000:8.1f}ms {nc:6d}x  {fname} ({filename}:{line})")
+    return "\n".join(lines)
+
+
+if os.getenv("PROFILE_HANDLERS") == "1":
+    enable()
@@ -0,0 +1,120 @@
+# records.py
+# Compact booking and student records used by the availability index, the handlers and /stats.
+from datetime import date
+from enum import IntEnum
+
+
+class Shift(IntEnum):
+    MORNING = 0
+    AFTERNOON = 1
+    NIGHT = 2
+
+    @property
+    def label(self):
+        return SHIFT_LABELS[self]
+
+    def __str__(self):
+        return self.label
+
+    @classmethod
+    def parse(cls, value):
+        """Shift from a Shift or a label in any case; None when unknown."""
+        if isinstance(value, cls):
+            return value
+        return _SHIFT_BY_LABEL.get(str(value).strip().lower())
+
+
+SHIFT_LABELS = ("Morning", "Afternoon", "Night")
+_SHIFT_BY_LABEL = {label.lower(): Shift(i) for i, label in enumerate(SHIFT_LABELS)}
+
+# Fields projected from the bookings table (see storage.SCHEMAS) and their positions in the read tuples
+BOOKING_FIELDS = ("timestamp", "student_id", "name", "date", "shift")
+BOOKING_COLUMNS = {field: i for i, field in enumerate(BOOKING_FIELDS)}
+
+# Fields projected from a students file (see storage.STUDENTS_SCHEMA)
+STUDENT_FIELDS = ("student_id", "name", "night_shift", "is_admin", "special_user", "is_lic")
+
+
+def student_key(value):
+    """Student ID cell as a string; Excel may hand numeric IDs back as floats."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _flag(value):
+    return student_key(value).lower() in ("1", "true", "yes", "y")
+
+
+def to_ordinal(value):
+    """Day ordinal from a date cell: date, datetime or 'YYYY-MM-DD' string."""
+    if isinstance(value, date):
+        return value.toordinal()
+    s = str(value)
+    return date(int(s[:4]), int(s[5:7]), int(s[8:10])).toordinal()
+
+
+class Booking:
+    """One booked shift. Dates are kept as day ordinals and shifts as Shift values."""
+
+    __slots__ = ("ordinal", "shift", "student_id", "name", "timestamp")
+
+    def __init__(self, ordinal, shift, student_id, name=None, timestamp=None):
+        self.ordinal = ordinal
+        self.shift = shift
+        self.student_id = student_id
+        self.name = name
+        self.timestamp = timestamp
+
+    @property
+    def date(self):
+        return date.fromordinal(self.ordinal)
+
+    @property
+    def date_str(self):
+        return self.date.isoformat()
+
+    @property
+    def label(self):
+        """Text shown on the /cancel keyboard, e.g. '2025-06-03 - Morning'."""
+        return f"{self.date_str} - {self.shift.label}"
+
+    def __repr__(self):
+        return f"Booking({self.date_str}, {self.shift.label}, {self.student_id})"
+
+
+def parse_booking_row(row, columns=BOOKING_COLUMNS):
+    """Convert a bookings row to a Booking once; None for rows with an unknown shift or date."""
+    shift = Shift.parse(row[columns["shift"]])
+    if shift is None:
+        return None
+    try:
+        ordinal = to_ordinal(row[columns["date"]])
+    except (TypeError, ValueError):
+        return None
+    return Booking(ordinal, shift, student_key(row[columns["student_id"]]), row[columns["name"]], row[columns["timestamp"]])
+
+
+class Student:
+    """One row of a students file."""
+
+    __slots__ = ("student_id", "name", "night_shift", "is_admin", "special_user", "is_lic")
+
+    def __init__(self, student_id, name, night_shift=False, is_admin=False, special_user=False, is_lic=False):
+        self.student_id = student_id
+        self.name = name
+        self.night_shift = night_shift
+        self.is_admin = is_admin
+        self.special_user = special_user
+        self.is_lic = is_lic
+
+    def __repr__(self):
+        return f"Student({self.student_id}, {self.name!r})"
+
+
+def parse_student_row(row):
+    """Student from a row projected on STUDENT_FIELDS; None for rows without an ID or name."""
+    sid, name, night, admin, special, lic = row
+    if sid is None or name is None:
+        return None
+    return Student(student_key(sid), str(name).strip(), _flag(night), _flag(admin), _flag(special), _flag(lic))
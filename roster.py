@@ -0,0 +1,72 @@
+# roster.py
+# Per-date, per-shift rosters and LIC (shift lead) attendance verification.
+import threading
+from datetime import datetime, timedelta
+
+from records import Shift, BOOKING_FIELDS, parse_booking_row, student_key
+from storage import day_key
+from utils import SG_TZ
+
+# Summary-log action written for every verification; LIC / LIC Verified hold who verified and the result
+VERIFIED = "VERIFIED"
+PRESENT, ABSENT = "Present", "Absent"
+
+# Verification results are cached for this many days back
+VERIFICATION_CACHE_DAYS = 14
+
+
+class RosterService:
+    """
+    Rosters of one tenant. Dates from the current week on come straight from the availability
+    index, which is updated on every booking and cancellation; older dates are read from the
+    partitions. Verification results live in the summary log and are cached per date.
+    """
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        self._lock = threading.Lock()
+        self._verified = {}  # day ordinal -> {(Shift, student_id): (lic, status)}
+
+    def bookings(self, day, shift, today):
+        """Bookings of one slot, in booking order."""
+        self.index.refresh(today)
+        if self.index.start is not None and day >= self.index.start:
+            return self.index.roster(day, shift)
+        shift = Shift.parse(shift)
+        out = []
+        for row in self.store.read_rows("bookings", start=day, end=day, fields=BOOKING_FIELDS):
+            booking = parse_booking_row(row)
+            if booking is not None and booking.shift is shift:
+                out.append(booking)
+        return out
+
+    def verifications(self, day):
+        """{(Shift, student_id): (lic, status)} for a date; the latest verification of a student wins."""
+        ordinal = day.toordinal()
+        with self._lock:
+            cached = self._verified.get(ordinal)
+            if cached is not None:
+                return dict(cached)
+
+        # Verifications are logged on or after the shift date, so older summary partitions are skipped
+        found = {}
+        fields = ("action", "student_id", "date", "shift", "lic", "lic_verified")
+        for action, sid, date_val, shift, lic, status in self.store.read_rows("summary", start=day, fields=fields):
+            if action == VERIFIED and day_key(date_val) == day.isoformat() and Shift.parse(shift) is not None:
+                found[(Shift.parse(shift), student_key(sid))] = (lic, status)
+
+        with self._lock:
+            oldest = (datetime.now(SG_TZ).date() - timedelta(days=VERIFICATION_CACHE_DAYS)).toordinal()
+            for old in [o for o in self._verified if o < oldest]:
+                del self._verified[old]
+            self._verified.setdefault(ordinal, found)
+            return dict(self._verified[ordinal])
+
+    def verify(self, booking, lic, status, timestamp):
+        """Record the LIC's verdict for a booking in the summary log."""
+        self.verifications(booking.date)  # make sure the date is cached before updating it
+        self.store.append_row("summary", [timestamp, VERIFIED, booking.student_id, booking.name,
+                                          booking.date_str, booking.shift.label, lic, status])
+        with self._lock:
+            self._verified.setdefault(booking.ordinal, {})[(booking.shift, booking.student_id)] = (lic, status)
@@ -0,0 +1,135 @@
+# rush.py
+# Booking-window rush mode: pre-warm caches before each month opens and admit bookings first come, first served.
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from utils import SG_TZ as SG
+
+logger = logging.getLogger(__name__)
+
+# Bookings for a month open this many days before its 1st, at this hour SG time
+OPENING_DAYS_BEFORE = 5
+OPENING_HOUR = 18
+
+
+def opening_time(month_start, days_before=OPENING_DAYS_BEFORE, hour=OPENING_HOUR):
+    """SG datetime at which bookings for the month starting at month_start open."""
+    day = month_start - timedelta(days=days_before)
+    return SG.localize(datetime.combine(day, datetime.min.time()).replace(hour=hour))
+
+
+def window_open(day, sg_now, days_before=OPENING_DAYS_BEFORE, hour=OPENING_HOUR):
+    """Whether day can be booked at sg_now: the current month always, later months from their opening_time()."""
+    month_start = day.replace(day=1)
+    if month_start <= sg_now.date().replace(day=1):
+        return True
+    return sg_now >= opening_time(month_start, days_before, hour)
+
+
+def upcoming_openings(sg_now, days_before=OPENING_DAYS_BEFORE, hour=OPENING_HOUR):
+    """Yield (month_start, opening datetime) for the next few months, nearest first."""
+    month_start = sg_now.date().replace(day=1)
+    for _ in range(3):
+        month_start = (month_start + timedelta(days=32)).replace(day=1)
+        opens = opening_time(month_start, days_before, hour)
+        yield month_start, opens
+
+
+class AdmissionQueue:
+    """
+    FIFO of booking attempts processed by a single worker.
+    Each user holds at most one place in the queue, so repeated taps cannot jump ahead.
+    """
+
+    def __init__(self):
+        self._queue = deque()
+        self._queued = set()
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queue)
+
+    def submit(self, user_key, job):
+        """Queue job for user_key; returns (position, accepted). A user already queued keeps their place."""
+        with self._cond:
+            if user_key in self._queued:
+                for i, (key, _) in enumerate(self._queue, start=1):
+                    if key == user_key:
+                        return i, False
+            self._queue.append((user_key, job))
+            self._queued.add(user_key)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            self._cond.notify()
+            return len(self._queue), True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                user_key, job = self._queue[0]
+            try:
+                job()
+            except Exception:
+                logger.exception("Queued booking for %s failed", user_key)
+            finally:
+                with self._cond:
+                    self._queue.popleft()
+                    self._queued.discard(user_key)
+
+
+class RushMode:
+    """
+    Active from `lead` before each booking-window opening until `duration` after it.
+    mode "on" / "off" forces the state, "auto" follows the schedule.
+    prewarm(month_start) runs once per opening, the first time tick() sees the window.
+    opening_days_before / opening_hour follow the owning tenant's booking-window rule.
+    """
+
+    def __init__(self, prewarm, lead=timedelta(minutes=10), duration=timedelta(minutes=30), mode="auto",
+                 opening_days_before=OPENING_DAYS_BEFORE, opening_hour=OPENING_HOUR):
+        self.prewarm = prewarm
+        self.lead = lead
+        self.duration = duration
+        self.mode = mode
+        self.opening = (opening_days_before, opening_hour)
+        self.queue = AdmissionQueue()
+        self._warmed = set()
+        self._lock = threading.Lock()
+
+    def current_window(self, sg_now):
+        """(month_start, opening) whose rush window contains sg_now, or None."""
+        for month_start, opens in upcoming_openings(sg_now, *self.opening):
+            if opens - self.lead <= sg_now < opens + self.duration:
+                return month_start, opens
+        return None
+
+    def active(self, sg_now=None):
+        if self.mode == "on":
+            return True
+        if self.mode == "off":
+            return False
+        return self.current_window(sg_now or datetime.now(SG)) is not None
+
+    def tick(self, sg_now):
+        """Called periodically; pre-warms once when a rush window starts."""
+        if self.mode == "off":
+            return
+        window = self.current_window(sg_now)
+        if window is None and self.mode == "on":
+            window = (next(upcoming_openings(sg_now, *self.opening))[0], None)
+        if window is None:
+            return
+        month_start = window[0]
+        with self._lock:
+            if month_start in self._warmed:
+                return
+            self._warmed.add(month_start)
+        logger.info("Rush mode: pre-warming for %s", month_start)
+        self.prewarm(month_start)
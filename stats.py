@@ -0,0 +1,217 @@
+# stats.py
+# Utilization analytics for the /stats admin command.
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import storage
+from records import BOOKING_FIELDS, parse_booking_row
+from workbook import read_table
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Per-partition aggregates keyed by path, shared by all tenants; each entry remembers the file stamp it was built from
+_partition_cache = {}
+# Final report per tenant, keyed by the stamps of every partition it was built from
+_report_cache = {}
+_lock = threading.Lock()
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _aggregate_bookings(path):
+    agg = {"by_shift": Counter(), "by_weekday": Counter(), "by_week": Counter(),
+           "by_student": Counter(), "by_slot": Counter()}
+    for row in read_table(path, storage.SCHEMAS["bookings"], BOOKING_FIELDS):
+        b = parse_booking_row(row)
+        if b is None:
+            continue
+        day = b.date
+        shift = b.shift.label
+        agg["by_shift"][shift] += 1
+        agg["by_weekday"][(day.weekday(), shift)] += 1
+        agg["by_week"][day - timedelta(days=day.weekday())] += 1
+        agg["by_student"][(b.student_id, b.name)] += 1
+        agg["by_slot"][(day, shift)] += 1
+    return agg
+
+
+def _aggregate_cancellations(path):
+    agg = {"by_shift": Counter(), "same_day": 0}
+    for ts, date_val, shift in read_table(path, storage.SCHEMAS["cancellations"], ("timestamp", "date", "shift")):
+        agg["by_shift"][shift] += 1
+        if storage.day_key(ts) == storage.day_key(date_val):
+            agg["same_day"] += 1
+    return agg
+
+
+def _aggregate_summary(path):
+    # Event tuples are kept as-is; rebook pairing has to look across partitions
+    events = []
+    for ts, action, date_val, shift in read_table(path, storage.SCHEMAS["summary"], ("timestamp", "action", "date", "shift")):
+        if action in ("BOOKED", "CANCELLED"):
+            events.append((str(ts), action, storage.day_key(date_val), shift))
+    return events
+
+
+AGGREGATORS = {
+    "bookings": _aggregate_bookings,
+    "cancellations": _aggregate_cancellations,
+    "summary": _aggregate_summary,
+}
+
+
+def _partition_aggregates(store, table):
+    """Aggregates for each partition of a table, recomputing only files that changed."""
+    out = []
+    for _, path in store.partition_files(table):
+        stamp = _stamp(path)
+        cached = _partition_cache.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, AGGREGATORS[table](path))
+            _partition_cache[path] = cached
+        out.append(cached[1])
+    return out
+
+
+def _cache_key(store):
+    return tuple(
+        (path, _stamp(path))
+        for table in AGGREGATORS
+        for _, path in store.partition_files(table)
+    )
+
+
+def _merge(aggs, keys):
+    merged = {k: Counter() for k in keys}
+    for agg in aggs:
+        for k in keys:
+            merged[k].update(agg[k])
+    return merged
+
+
+def _rebook_latencies(events):
+    """Hours between each cancellation and the next booking of the same slot."""
+    pending = defaultdict(list)
+    latencies = []
+    for ts, action, date_key, shift in sorted(events):
+        slot = (date_key, shift)
+        when = datetime.strptime(ts[:19], "%Y-%m-%d %H:%M:%S")
+        if action == "CANCELLED":
+            pending[slot].append(when)
+        elif pending[slot]:
+            latencies.append((when - pending[slot].pop(0)).total_seconds() / 3600)
+    return latencies
+
+
+def _pct(num, den):
+    return f"{100 * num / den:.0f}%" if den else "n/a"
+
+
+def build_report(tenant):
+    store = tenant.store
+    shifts = list(tenant.shift_options)
+    bookings = _merge(_partition_aggregates(store, "bookings"),
+                      ["by_shift", "by_weekday", "by_week", "by_student", "by_slot"])
+    cancel_aggs = _partition_aggregates(store, "cancellations")
+    cancellations = _merge(cancel_aggs, ["by_shift"])["by_shift"]
+    same_day = sum(a["same_day"] for a in cancel_aggs)
+    events = [e for agg in _partition_aggregates(store, "summary") for e in agg]
+
+    if not bookings["by_slot"] and not cancellations:
+        return "No booking data yet."
+
+    # Capacity over every day between the first and last booked date
+    days = [d for d, _ in bookings["by_slot"]]
+    capacity_shift = Counter()
+    capacity_weekday = Counter()
+    capacity_week = Counter()
+    if days:
+        day = min(days)
+        while day <= max(days):
+            week = day - timedelta(days=day.weekday())
+            for shift in shifts:
+                cap = tenant.shift_capacity(shift, day)
+                capacity_shift[shift] += cap
+                capacity_weekday[(day.weekday(), shift)] += cap
+                capacity_week[week] += cap
+            day += timedelta(days=1)
+
+    lines = ["Utilization Stats" if tenant.key == "default" else f"Utilization Stats ({tenant.name})", ""]
+    if days:
+        lines.append(f"Period: {min(days)} to {max(days)}")
+    lines.append("")
+    lines.append("Fill rate per shift:")
+    for shift in shifts:
+        booked = bookings["by_shift"][shift]
+        lines.append(f"• {shift}: {booked}/{capacity_shift[shift]} ({_pct(booked, capacity_shift[shift])})")
+
+    lines.append("")
+    lines.append("Fill rate per weekday:")
+    for wd, label in enumerate(WEEKDAYS):
+        booked = sum(bookings["by_weekday"][(wd, s)] for s in shifts)
+        cap = sum(capacity_weekday[(wd, s)] for s in shifts)
+        if cap:
+            lines.append(f"• {label}: {booked}/{cap} ({_pct(booked, cap)})")
+
+    lines.append("")
+    lines.append("Fill rate per week (last 8):")
+    for week in sorted(capacity_week)[-8:]:
+        booked = bookings["by_week"][week]
+        lines.append(f"• w/c {week}: {booked}/{capacity_week[week]} ({_pct(booked, capacity_week[week])})")
+
+    total_booked = sum(bookings["by_shift"].values())
+    total_cancelled = sum(cancellations.values())
+    lines.append("")
+    lines.append(f"Cancellations: {total_cancelled} ({_pct(total_cancelled, total_booked + total_cancelled)} of all bookings)")
+    for shift in shifts:
+        c = cancellations[shift]
+        lines.append(f"• {shift}: {c} ({_pct(c, bookings['by_shift'][shift] + c)})")
+    lines.append(f"• Same-day: {same_day}")
+
+    latencies = sorted(_rebook_latencies(events))
+    lines.append("")
+    if latencies:
+        median = latencies[len(latencies) // 2]
+        lines.append(f"Rebooked after cancel: {len(latencies)}/{total_cancelled}, "
+                     f"median {median:.1f}h, mean {sum(latencies) / len(latencies):.1f}h")
+    else:
+        lines.append("Rebooked after cancel: none")
+
+    per_student = bookings["by_student"]
+    lines.append("")
+    lines.append(f"Bookings per student: {len(per_student)} students, "
+                 f"avg {total_booked / len(per_student):.1f}" if per_student else "Bookings per student: none")
+    for (sid, name), count in per_student.most_common(10):
+        lines.append(f"• {name} ({sid}): {count}")
+
+    return "\n".join(lines)
+
+
+def cached_report(tenant):
+    """The tenant's report if it is still current, else None (without building it)."""
+    key = _cache_key(tenant.store)
+    with _lock:
+        cached = _report_cache.get(tenant.key)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    return None
+
+
+def get_report(tenant):
+    """
+    Cached report for a tenant; only partitions whose files changed since the last call are re-read.
+    The report is built outside _lock, so cached_report() never waits for a cold build.
+    """
+    report = cached_report(tenant)
+    if report is not None:
+        return report
+    key = _cache_key(tenant.store)
+    report = build_report(tenant)
+    with _lock:
+        _report_cache[tenant.key] = (key, report)
+    return report
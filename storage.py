@@ -0,0 +1,330 @@
+# storage.py
+# Month-partitioned workbook storage for bookings, cancellations and the summary log.
+import os
+import stat
+import shutil
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from openpyxl import load_workbook, Workbook
+
+from workbook import Schema, read_table
+
+logger = logging.getLogger(__name__)
+# === Partition layout ===
+# Each table is split into one workbook per month, e.g. partitions/bookings-2025-06.xlsx.
+# Months before the current one are moved to archive/ and made read-only.
+# Every tenant has its own data directory (see tenants.py); DATA_DIR is the default one.
+DATA_DIR = os.getenv("DATA_DIR", ".")
+
+# Table schemas. Rows are written in this column order; reads resolve columns by header name,
+# which also accepts the legacy single-file workbooks ("timeStamp", "studentID", "LIC vertified", ...).
+SCHEMAS = {
+    "bookings": Schema("bookings", {
+        "timestamp": "Timestamp", "student_id": "StudentID", "name": "Name", "date": "Date", "shift": "Shift",
+    }),
+    "cancellations": Schema("cancellations", {
+        "timestamp": "Timestamp", "student_id": "StudentID", "name": "Name", "date": "Date", "shift": "Shift",
+        "lic": "LIC", "lic_verified": ("LIC Verified", "LIC vertified"),
+    }, optional=("lic", "lic_verified")),
+    "summary": Schema("summary", {
+        "timestamp": "Timestamp", "action": "Action", "student_id": "StudentID", "name": "Name", "date": "Date",
+        "shift": "Shift", "lic": "LIC", "lic_verified": ("LIC Verified", "LIC vertified"),
+    }, optional=("lic", "lic_verified")),
+}
+HEADERS = {table: schema.headers for table, schema in SCHEMAS.items()}
+
+# Students roster (one file per tenant, maintained by hand). Only ID and name are required.
+# IsLIC marks shift leads who may verify attendance (admins always may).
+STUDENTS_SCHEMA = Schema("students", {
+    "student_id": "StudentID", "name": "Name", "contact": "Contact",
+    "night_shift": "NightShift", "is_admin": "IsAdmin", "special_user": "SpecialUser", "is_lic": "IsLIC",
+}, optional=("contact", "night_shift", "is_admin", "special_user", "is_lic"))
+
+# Field that decides which month a row belongs to.
+# Bookings and cancellations follow the shift date, the summary log follows the event time.
+PARTITION_FIELD = {
+    "bookings": "date",
+    "cancellations": "date",
+    "summary": "timestamp",
+}
+PARTITION_COLUMN = {table: list(SCHEMAS[table].fields).index(field) for table, field in PARTITION_FIELD.items()}
+
+
+def day_key(value):
+    """Normalise a date cell (str, date or datetime) to 'YYYY-MM-DD'."""
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+def month_key(value):
+    return day_key(value)[:7]
+
+
+def partition_month(value):
+    """'YYYY-MM' of a partition cell; ValueError unless it is a date, datetime or ISO date string."""
+    key = day_key(value) if value is not None else ""
+    datetime.strptime(key, "%Y-%m-%d")
+    return key[:7]
+
+
+def save_atomic(wb, path):
+    """
+    Save next to path, then swap the file in. Readers never take the write lock, so they must
+    only ever see the old or the new workbook, not a half-written one.
+    """
+    tmp = path + ".tmp"
+    wb.save(tmp)
+    os.replace(tmp, path)
+
+
+def months_between(start, end):
+    """All 'YYYY-MM' keys from start's month to end's month inclusive."""
+    year, month = start.year, start.month
+    out = []
+    while (year, month) <= (end.year, end.month):
+        out.append(f"{year:04d}-{month:02d}")
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return out
+
+
+class PartitionStore:
+    """
+    The partitions of one data directory. Each store has its own write lock and data versions,
+    so a slow save for one tenant never blocks another.
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.partition_dir = os.path.join(data_dir, "partitions")
+        self.archive_dir = os.path.join(data_dir, "archive")
+        # Serialises read-modify-write cycles on partition files
+        self._write_lock = threading.RLock()
+        self._versions = {table: 0 for table in HEADERS}
+        # Lock wait accounting, to spot file-write contention
+        self.write_stats = {"writes": 0, "wait_seconds": 0.0, "max_wait": 0.0}
+
+    @contextmanager
+    def _locked(self):
+        started = time.perf_counter()
+        with self._write_lock:
+            waited = time.perf_counter() - started
+            self.write_stats["writes"] += 1
+            self.write_stats["wait_seconds"] += waited
+            self.write_stats["max_wait"] = max(self.write_stats["max_wait"], waited)
+            yield
+
+    def data_version(self, table=None):
+        """Counter bumped on every write to a table (or any table), used by callers to invalidate caches."""
+        if table is None:
+            return sum(self._versions.values())
+        return self._versions[table]
+
+    def _bump_version(self, table):
+        self._versions[table] += 1
+
+    def partition_path(self, table, month):
+        return os.path.join(self.partition_dir, f"{table}-{month}.xlsx")
+
+    def archive_path(self, table, month):
+        return os.path.join(self.archive_dir, f"{table}-{month}.xlsx")
+
+    def list_months(self, table):
+        """Months that have a partition for this table, hot or archived."""
+        months = set()
+        prefix = f"{table}-"
+        for folder in (self.partition_dir, self.archive_dir):
+            if not os.path.isdir(folder):
+                continue
+            for fname in os.listdir(folder):
+                if fname.startswith(prefix) and fname.endswith(".xlsx"):
+                    months.add(fname[len(prefix):-len(".xlsx")])
+        return sorted(months)
+
+    def partition_files(self, table):
+        """(month, path) for every partition file of a table, oldest first."""
+        return [(m, p) for m in self.list_months(table) for p in self._existing_paths(table, m)]
+
+    def _existing_paths(self, table, month):
+        return [p for p in (self.archive_path(table, month), self.partition_path(table, month)) if os.path.exists(p)]
+
+    # === Query layer ===
+    def read_rows(self, table, start=None, end=None, fields=None):
+        """
+        Yield data rows of a table whose partition date lies within [start, end].
+        Only the month partitions overlapping the range are opened. Rows are tuples of the
+        requested fields (see SCHEMAS), or of every column in schema order when fields is None.
+        """
+        months = self.list_months(table)
+        if start is not None:
+            months = [m for m in months if m >= start.strftime("%Y-%m")]
+        if end is not None:
+            months = [m for m in months if m <= end.strftime("%Y-%m")]
+
+        lo = start.strftime("%Y-%m-%d") if start is not None else None
+        hi = end.strftime("%Y-%m-%d") if end is not None else None
+        schema = SCHEMAS[table]
+        fields = tuple(fields or schema.fields)
+        # The partition field is read alongside the requested ones when it is not among them
+        wanted = fields if PARTITION_FIELD[table] in fields else fields + (PARTITION_FIELD[table],)
+        col = wanted.index(PARTITION_FIELD[table])
+        for month in months:
+            for path in self._existing_paths(table, month):
+                for row in read_table(path, schema, wanted):
+                    key = day_key(row[col])
+                    if lo is not None and key < lo:
+                        continue
+                    if hi is not None and key > hi:
+                        continue
+                    yield row if wanted is fields else row[:-1]
+
+    def _open_for_write(self, table, month):
+        path = self.partition_path(table, month)
+        if os.path.exists(path):
+            return load_workbook(path), path
+        os.makedirs(self.partition_dir, exist_ok=True)
+        wb = Workbook()
+        ws = wb.active
+        ws.title = table.capitalize()
+        ws.append(HEADERS[table])
+        return wb, path
+
+    def ensure_partition(self, table, month):
+        """Create an empty partition ahead of time so the first write does not pay for it."""
+        with self._locked():
+            if not os.path.exists(self.partition_path(table, month)):
+                wb, path = self._open_for_write(table, month)
+                save_atomic(wb, path)
+
+    def append_rows(self, table, rows):
+        """
+        Append rows, saving each touched month partition once.
+        Raises ValueError, before writing anything, if a row's partition field is not a date.
+        """
+        col = PARTITION_COLUMN[table]
+        by_month = {}
+        for row in rows:
+            try:
+                month = partition_month(row[col])
+            except ValueError:
+                raise ValueError(f"{table}: {PARTITION_FIELD[table]} {row[col]!r} is not a YYYY-MM-DD date") from None
+            by_month.setdefault(month, []).append(row)
+
+        with self._locked():
+            for month, month_rows in by_month.items():
+                wb, path = self._open_for_write(table, month)
+                ws = wb.active
+                for row in month_rows:
+                    ws.append(list(row))
+                save_atomic(wb, path)
+            self._bump_version(table)
+
+    def append_row(self, table, row):
+        self.append_rows(table, [row])
+
+    def delete_first(self, table, on_date, predicate):
+        """
+        Delete the first row in on_date's hot partition for which predicate(record) holds.
+        record maps the schema's field names to the row's values.
+        """
+        path = self.partition_path(table, on_date.strftime("%Y-%m"))
+        with self._locked():
+            if not os.path.exists(path):
+                return False
+            wb = load_workbook(path)
+            ws = wb.active
+            columns = SCHEMAS[table].resolve(next(ws.iter_rows(max_row=1, values_only=True), None), path)
+            for row in ws.iter_rows(min_row=2):
+                record = {f: row[i].value if i is not None and i < len(row) else None for f, i in columns.items()}
+                if predicate(record):
+                    ws.delete_rows(row[0].row)
+                    save_atomic(wb, path)
+                    self._bump_version(table)
+                    return True
+        return False
+
+    def probe(self, lock_timeout=5):
+        """
+        Time a read of the newest bookings partition and a small write next to the partitions.
+        Raises if a partition cannot be opened or the write lock stays held longer than lock_timeout.
+        """
+        started = time.perf_counter()
+        months = self.list_months("bookings")
+        if months:
+            for path in self._existing_paths("bookings", months[-1]):
+                load_workbook(path, read_only=True).close()
+        read_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        if not self._write_lock.acquire(timeout=lock_timeout):
+            raise TimeoutError(f"storage write lock held for more than {lock_timeout}s")
+        try:
+            os.makedirs(self.partition_dir, exist_ok=True)
+            probe_path = os.path.join(self.partition_dir, ".probe")
+            with open(probe_path, "w") as f:
+                f.write(str(time.time()))
+            os.remove(probe_path)
+        finally:
+            self._write_lock.release()
+        write_ms = (time.perf_counter() - started) * 1000
+        return {"read_ms": round(read_ms, 1), "write_ms": round(write_ms, 1)}
+
+    # === Maintenance ===
+    def migrate_legacy(self, table, legacy_file):
+        """
+        Split a pre-partitioning workbook into month partitions (runs once per table).
+        Columns are mapped by header, so the legacy column order does not matter.
+        Rows without a valid date cannot be placed in a month and are skipped with a warning.
+        """
+        if self.list_months(table) or not os.path.exists(legacy_file):
+            return 0
+        col = PARTITION_COLUMN[table]
+        rows, skipped = [], []
+        for row in read_table(legacy_file, SCHEMAS[table]):
+            try:
+                partition_month(row[col])
+                rows.append(row)
+            except ValueError:
+                skipped.append(row)
+        if skipped:
+            logger.warning("%s: skipped %d rows without a valid %s, e.g. %r",
+                           legacy_file, len(skipped), PARTITION_FIELD[table], skipped[0])
+        if rows:
+            self.append_rows(table, rows)
+        return len(rows)
+
+    def rotate_archive(self, today):
+        """Move partitions of months before today's month into the read-only archive."""
+        current = today.strftime("%Y-%m")
+        moved = []
+        with self._locked():
+            if not os.path.isdir(self.partition_dir):
+                return moved
+            for fname in sorted(os.listdir(self.partition_dir)):
+                if not fname.endswith(".xlsx"):
+                    continue
+                parts = fname[:-len(".xlsx")].rsplit("-", 2)  # table, year, month
+                if len(parts) != 3 or parts[0] not in SCHEMAS or f"{parts[1]}-{parts[2]}" >= current:
+                    continue
+                os.makedirs(self.archive_dir, exist_ok=True)
+                src = os.path.join(self.partition_dir, fname)
+                dest = os.path.join(self.archive_dir, fname)
+                if os.path.exists(dest):
+                    # Month was written again after rotation; fold the late rows into the archive
+                    os.chmod(dest, stat.S_IRUSR | stat.S_IWUSR)
+                    wb = load_workbook(dest)
+                    for row in read_table(src, SCHEMAS[parts[0]]):
+                        wb.active.append(list(row))
+                    save_atomic(wb, dest)
+                    os.remove(src)
+                else:
+                    shutil.move(src, dest)
+                os.chmod(dest, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                moved.append(dest)
+        return moved
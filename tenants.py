@@ -0,0 +1,134 @@
+# tenants.py
+# Per-tenant configuration for serving several groups/sites from one bot process.
+# Each tenant has its own shifts, capacities, booking rules, notification groups and data directory.
+import os
+import json
+import threading
+
+import storage
+from availability import BookingIndex
+from exports import ExportCursors, CURSOR_FILE
+from roster import RosterService
+from records import SHIFT_LABELS, STUDENT_FIELDS, parse_student_row
+from workbook import read_table
+from rush import OPENING_DAYS_BEFORE, OPENING_HOUR
+from utils import SHIFT_OPTIONS, SHIFT_CAPACITY, NIGHT_SHIFT_WEEKDAYS
+
+# Booking rules; a tenant config overrides any subset of these
+DEFAULT_RULES = {
+    "max_per_week": 4,               # regular students
+    "max_per_week_special": 2,       # students flagged specialUser
+    "cap_exempt_days": 5,            # the weekly cap does not apply this many days ahead
+    "cap_exempt_hours_special": 48,  # ... or this many hours ahead for special users
+    "opening_days_before": OPENING_DAYS_BEFORE,
+    "opening_hour": OPENING_HOUR,
+}
+
+
+class Tenant:
+    """
+    Config and per-tenant state. Data (partitions, students file, availability index,
+    cancelled-shift set) never crosses tenants; bot, digest and stats caches are shared.
+    """
+
+    def __init__(self, key, name=None, data_dir=storage.DATA_DIR, students_file="students.xlsx", legacy_dir=None,
+                 group_1_chat_id=None, group_2_chat_id=None, shifts=None, capacities=None,
+                 night_weekdays=NIGHT_SHIFT_WEEKDAYS, rules=None):
+        shifts = shifts or SHIFT_OPTIONS
+        unknown = [s for s in shifts if s not in SHIFT_LABELS]
+        if unknown:
+            raise ValueError(f"Tenant {key}: unknown shifts {unknown}, expected a subset of {list(SHIFT_LABELS)}")
+        unknown = [r for r in (rules or {}) if r not in DEFAULT_RULES]
+        if unknown:
+            raise ValueError(f"Tenant {key}: unknown rules {unknown}")
+
+        self.key = key
+        self.name = name or key
+        # label -> (start, end), kept in Shift order
+        self.shift_options = {s: tuple(shifts[s]) for s in SHIFT_LABELS if s in shifts}
+        self.capacities = dict(SHIFT_CAPACITY, **(capacities or {}))
+        self.night_weekdays = tuple(night_weekdays)
+        self.rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.group_1_chat_id = group_1_chat_id
+        self.group_2_chat_id = group_2_chat_id
+        self.students_file = students_file
+        self.legacy_dir = data_dir if legacy_dir is None else legacy_dir
+
+        self.store = storage.PartitionStore(data_dir)
+        self.index = BookingIndex(self.store)
+        self.roster = RosterService(self.store, self.index)
+        self.booking_lock = threading.Lock()  # serialises capacity check + write within this tenant
+        self.cancelled_shifts = set()         # (date, shift) cancelled and not yet rebooked
+        self.rush = None                      # RushMode, set up by main.py
+        self.export_cursors = ExportCursors(os.path.join(data_dir, CURSOR_FILE))
+        self._students = {"stamp": None, "rows": {}}
+
+    def __repr__(self):
+        return f"Tenant({self.key!r})"
+
+    def shift_capacity(self, shift, day):
+        """Number of slots for a shift on a given date."""
+        if shift not in self.shift_options:
+            return 0
+        if shift == "Night" and day.weekday() not in self.night_weekdays:
+            return 0
+        return self.capacities.get(shift, 0)
+
+    def legacy_file(self, table):
+        """Pre-partitioning workbook of a table, migrated on first start."""
+        return os.path.join(self.legacy_dir, f"{table}.xlsx")
+
+    def student_info(self, student_id):
+        """
+        Student record from students_file; the file is cached and reloaded only when it changes on disk.
+        Columns are found by header (see storage.STUDENTS_SCHEMA), so a leading timestamp column is fine.
+        """
+        if not os.path.exists(self.students_file):
+            return None
+        stamp = os.path.getmtime(self.students_file)
+        if self._students["stamp"] != stamp:
+            rows = {}
+            for row in read_table(self.students_file, storage.STUDENTS_SCHEMA, STUDENT_FIELDS):
+                student = parse_student_row(row)
+                if student is not None:
+                    rows.setdefault(student.student_id, student)
+            self._students["stamp"] = stamp
+            self._students["rows"] = rows
+        return self._students["rows"].get(str(student_id))
+
+    @property
+    def students_loaded(self):
+        return self._students["stamp"] is not None
+
+
+def load_tenants(path, **defaults):
+    """
+    Tenants keyed by code, plus the default tenant's code.
+
+    path is a JSON file: {"default": "<code>", "tenants": {"<code>": {<Tenant keyword arguments>}}}.
+    Without the file, a single tenant "default" is built from the keyword arguments, which
+    reproduces the single-site deployment.
+    """
+    if not path or not os.path.exists(path):
+        return {"default": Tenant("default", **defaults)}, "default"
+
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    tenants = {key: Tenant(key, **options) for key, options in config["tenants"].items()}
+    if not tenants:
+        raise ValueError(f"{path}: no tenants configured")
+
+    # Isolation: no two tenants may share a data directory or a students file
+    for attr in ("data_dir", "students_file"):
+        seen = {}
+        for tenant in tenants.values():
+            value = tenant.store.data_dir if attr == "data_dir" else tenant.students_file
+            value = os.path.abspath(value)
+            if value in seen:
+                raise ValueError(f"{path}: tenants {seen[value]} and {tenant.key} share {attr} {value}")
+            seen[value] = tenant.key
+
+    default = config.get("default", next(iter(tenants)))
+    if default not in tenants:
+        raise ValueError(f"{path}: default tenant {default!r} is not configured")
+    return tenants, default
@@ -0,0 +1,52 @@
+# Modules live at the repository root; make them importable however pytest is invoked.
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# storage reads DATA_DIR when first imported, which test modules do before any fixture runs
+BOT_DIR = tempfile.mkdtemp(prefix="shiftbook-tests-")
+os.environ["DATA_DIR"] = BOT_DIR
+
+# (student id, name, night shift, admin, special user)
+STUDENTS = [
+    (2400000, "Ann", 1, 1, 0),
+    (2400001, "Ben", 1, 0, 0),
+    (2400002, "Cat", 0, 0, 1),
+    (2400003, "Dan", 1, 0, 0),
+]
+
+
+@pytest.fixture(scope="session")
+def bot_dir():
+    """Data directory of bot_main; the bot looks up students.xlsx relative to it."""
+    yield BOT_DIR
+    shutil.rmtree(BOT_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def bot_main(bot_dir):
+    """main.py imported once against an empty data directory with a small students file; nothing is polled."""
+    workdir = bot_dir
+    wb = Workbook()
+    wb.active.append(["StudentID", "Name", "NightShift", "IsAdmin", "SpecialUser"])
+    for row in STUDENTS:
+        wb.active.append(list(row))
+    wb.save(os.path.join(workdir, "students.xlsx"))
+
+    cwd = os.getcwd()
+    os.environ.update(BOT_TOKEN="1:test", DATA_DIR=workdir, TENANTS_FILE="", RUSH_MODE="off")
+    os.chdir(workdir)
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    yield main
+    # Written now, not by main's atexit hooks after bot_dir is gone
+    main.logged_in_users.flush()
+    main.conversations.flush()
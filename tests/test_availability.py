@@ -0,0 +1,85 @@
+# BookingIndex: our own writes are applied in place, anything interleaved falls back to a rebuild.
+from datetime import date
+
+import pytest
+
+from availability import BookingIndex
+from records import Booking, Shift
+from storage import PartitionStore
+
+TODAY = date(2030, 2, 4)
+DAY = date(2030, 2, 6)
+
+
+def row(sid, day=DAY, shift="Morning"):
+    return ["2030-02-01 09:00:00", sid, f"user{sid}", day.isoformat(), shift]
+
+
+def booking(sid, day=DAY, shift="Morning"):
+    return Booking(day.toordinal(), Shift.parse(shift), str(sid), f"user{sid}", "2030-02-01 09:00:00")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PartitionStore(str(tmp_path))
+
+
+@pytest.fixture
+def index(store):
+    return BookingIndex(store).refresh(TODAY)
+
+
+def no_rebuild(index, monkeypatch):
+    monkeypatch.setattr(index, "_rebuild", lambda start: pytest.fail("index was rebuilt"))
+
+
+def test_apply_bookings_updates_in_place(store, index, monkeypatch):
+    version = store.data_version("bookings")
+    store.append_rows("bookings", [row(1), row(1, date(2030, 2, 7))])
+    index.apply_bookings([booking(1), booking(1, date(2030, 2, 7))], version)
+
+    no_rebuild(index, monkeypatch)
+    index.refresh(TODAY)
+    assert index.count(DAY, "Morning") == 1
+    assert [b.date_str for b in index.user_bookings(1)] == ["2030-02-06", "2030-02-07"]
+
+
+def test_interleaved_write_falls_back_to_rebuild(store, index):
+    version = store.data_version("bookings")
+    store.append_rows("bookings", [row(1)])
+    store.append_row("bookings", row(2))  # another writer got in before apply_bookings
+    index.apply_bookings([booking(1)], version)
+    assert index.version is None
+    assert index.count(DAY, "Morning") == 0  # not applied on top of a stale index
+
+    index.refresh(TODAY)
+    assert index.count(DAY, "Morning") == 2
+    assert [b.student_id for b in index.roster(DAY, "Morning")] == ["1", "2"]
+
+
+def test_apply_cancellation_removes_in_place(store, index, monkeypatch):
+    store.append_rows("bookings", [row(1), row(2)])
+    index.refresh(TODAY)
+
+    version = store.data_version("bookings")
+    assert store.delete_first("bookings", DAY, lambda r: str(r["student_id"]) == "1")
+    index.apply_cancellation(booking(1), version)
+
+    no_rebuild(index, monkeypatch)
+    index.refresh(TODAY)
+    assert [b.student_id for b in index.roster(DAY, "Morning")] == ["2"]
+    assert index.user_bookings(1) == []
+
+
+def test_cancellation_after_interleaved_write_falls_back_to_rebuild(store, index):
+    store.append_rows("bookings", [row(1)])
+    index.refresh(TODAY)
+
+    version = store.data_version("bookings")
+    store.delete_first("bookings", DAY, lambda r: str(r["student_id"]) == "1")
+    store.append_row("bookings", row(3))
+    index.apply_cancellation(booking(1), version)
+    assert index.version is None
+
+    index.refresh(TODAY)
+    assert [b.student_id for b in index.roster(DAY, "Morning")] == ["3"]
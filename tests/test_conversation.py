@@ -0,0 +1,119 @@
+# Pending dialogs and sessions: TTL expiry, size-cap eviction and persistence across restarts.
+import pytest
+
+import conversation
+from conversation import ConversationStore, SessionStore, make_backend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(conversation.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["dialogs.json", "dialogs.db"])
+def backend_path(request, tmp_path):
+    return str(tmp_path / request.param)
+
+
+def test_entries_expire_after_ttl(clock):
+    store = ConversationStore(ttl=60)
+    store.set(1, "student_id", tenant=None)
+    clock.now += 59
+    assert store.get(1) == ("student_id", {"tenant": None})
+    clock.now += 2
+    assert store.get(1) is None
+    assert len(store) == 0
+
+
+def test_set_restarts_ttl_and_pop_removes(clock):
+    store = ConversationStore(ttl=60)
+    store.set(1, "student_id")
+    clock.now += 50
+    store.set(1, "student_name", sid="2400001")
+    clock.now += 50
+    assert store.pop(1) == ("student_name", {"sid": "2400001"})
+    assert store.pop(1) is None
+
+
+def test_least_recently_updated_is_evicted(clock):
+    store = ConversationStore(ttl=60, max_entries=2)
+    store.set(1, "a")
+    store.set(2, "b")
+    store.set(1, "a2")  # 1 is now the most recent
+    store.set(3, "c")
+    assert store.get(2) is None
+    assert store.get(1) == ("a2", {})
+    assert store.get(3) == ("c", {})
+
+
+def test_purge_drops_only_expired(clock):
+    store = ConversationStore(ttl=60)
+    store.set(1, "a")
+    clock.now += 30
+    store.set(2, "b")
+    clock.now += 40
+    assert store.purge() == 1
+    assert [cid for cid, _, _ in store.live()] == [2]
+
+
+def test_persistence_keeps_live_entries_only(clock, backend_path):
+    store = ConversationStore(ttl=60, max_entries=2, backend=make_backend(backend_path))
+    store.set(1, "a", n=1)
+    store.set(2, "b", n=2)
+    store.set(3, "c", n=3)  # evicts 1
+    store.pop(2)
+    store.set(4, "d", n=4)
+    clock.now += 30
+    store.set(5, "e", n=5)  # evicts 3
+    store.flush()
+
+    clock.now += 40  # 4 has expired, 5 has not
+    reloaded = ConversationStore(ttl=60, max_entries=2, backend=make_backend(backend_path))
+    assert [cid for cid, _, _ in reloaded.live()] == [5]
+    assert reloaded.get(5) == ("e", {"n": 5})
+
+
+def test_sessions_survive_restart(clock, backend_path):
+    sessions = SessionStore(ttl=3600, backend=make_backend(backend_path))
+    sessions[7] = {"student_id": "2400001", "tenant": "default"}
+    assert 7 in sessions
+    sessions.flush()
+
+    reloaded = SessionStore(ttl=3600, backend=make_backend(backend_path))
+    assert reloaded.get(7) == {"student_id": "2400001", "tenant": "default"}
+    assert reloaded.items() == [(7, {"student_id": "2400001", "tenant": "default"})]
+    assert reloaded.get(8, {}) == {}
+
+    clock.now += 3601
+    assert 7 not in reloaded
+
+
+def test_json_backend_batches_writes(clock, tmp_path, monkeypatch):
+    path = str(tmp_path / "sessions.json")
+    backend = conversation.JsonFileBackend(path, delay=3600)
+    writes = []
+    real_replace = conversation.os.replace
+    monkeypatch.setattr(conversation.os, "replace", lambda src, dst: (writes.append(dst), real_replace(src, dst)))
+
+    store = ConversationStore(ttl=60, max_entries=1000, backend=backend)
+    for cid in range(1500):  # 500 evictions
+        store.set(cid, "a")
+    clock.now += 61
+    assert store.purge() == 1000
+    store.set(9999, "b")
+    assert writes == []
+
+    store.flush()
+    assert writes == [path]
+    reloaded = ConversationStore(ttl=60, backend=make_backend(path))
+    assert [cid for cid, _, _ in reloaded.live()] == [9999]
@@ -0,0 +1,53 @@
+# Group notification digest: batching per chat, urgent messages sent straight away.
+from digest import MAX_MESSAGE_LENGTH, DigestNotifier
+
+
+class Outbox(list):
+    def __call__(self, chat_id, text):
+        self.append((chat_id, text))
+
+
+def test_urgent_messages_skip_the_digest():
+    sent = Outbox()
+    digest = DigestNotifier(sent, window=3600)
+    digest.notify(-1, "Booked: Ann")
+    digest.notify(-1, "Cancelled today: Ben", urgent=True)
+    assert sent == [(-1, "Cancelled today: Ben")]
+    assert digest.pending_count() == 1
+
+    digest.flush()
+    assert sent[1:] == [(-1, "Booked: Ann")]
+    assert digest.pending_count() == 0
+
+
+def test_messages_are_batched_per_chat():
+    sent = Outbox()
+    digest = DigestNotifier(sent, window=3600)
+    for chat_id, text in [(-1, "a"), (-2, "b"), (-1, "c")]:
+        digest.notify(chat_id, text)
+    assert sent == []
+
+    digest.flush(-1)
+    assert len(sent) == 1
+    chat_id, text = sent[0]
+    assert chat_id == -1 and text.startswith("Digest: 2 updates") and text.endswith("\n• a\n• c")
+    assert digest.pending_count() == 1
+    digest.flush()
+    assert sent[1] == (-2, "b")
+
+
+def test_window_zero_sends_immediately():
+    sent = Outbox()
+    DigestNotifier(sent, window=0).notify(-1, "a")
+    assert sent == [(-1, "a")]
+
+
+def test_long_digests_are_split_under_the_limit():
+    sent = Outbox()
+    digest = DigestNotifier(sent, window=3600)
+    for i in range(100):
+        digest.notify(-1, f"{i:03d} " + "x" * 100)
+    digest.flush()
+    assert len(sent) > 1
+    assert all(len(text) <= MAX_MESSAGE_LENGTH for _, text in sent)
+    assert sum(text.count("\n• ") for _, text in sent) == 100
@@ -0,0 +1,153 @@
+# Per-chat ordered dispatch: ordering within a chat, parallelism across chats, overflow handling.
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from dispatch import ChatDispatcher, chat_key
+
+
+def message_update(update_id, chat_id):
+    return SimpleNamespace(update_id=update_id, message=SimpleNamespace(chat=SimpleNamespace(id=chat_id)))
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_chat_key():
+    call = SimpleNamespace(update_id=1, message=None, edited_message=None, channel_post=None, edited_channel_post=None,
+                           callback_query=SimpleNamespace(message=SimpleNamespace(chat=SimpleNamespace(id=5)),
+                                                          from_user=SimpleNamespace(id=9)))
+    assert chat_key(call) == 5
+    assert chat_key(message_update(1, -100)) == -100
+    assert chat_key(SimpleNamespace(update_id=3)) == ("update", 3)
+
+
+def test_updates_of_a_chat_stay_in_order():
+    seen = {}
+    lock = threading.Lock()
+    rng = random.Random(1)
+
+    def process(updates):
+        time.sleep(rng.random() / 1000)
+        with lock:
+            seen.setdefault(updates[0].message.chat.id, []).append(updates[0].update_id)
+
+    dispatcher = ChatDispatcher(process, workers=4, max_per_chat=100)
+    dispatcher.submit([message_update(i, i % 7) for i in range(350)])
+    wait_until(lambda: dispatcher.stats()["processed"] == 350)
+    assert sorted(seen) == list(range(7))
+    for chat, ids in seen.items():
+        assert ids == [i for i in range(350) if i % 7 == chat]
+
+
+def test_slow_chat_does_not_block_other_workers():
+    release = threading.Event()
+    done = []
+
+    def process(updates):
+        if updates[0].message.chat.id == 0:
+            release.wait(5)
+        done.append(updates[0].update_id)
+
+    dispatcher = ChatDispatcher(process, workers=2)
+    dispatcher.submit([message_update(1, 0), message_update(2, 1)])  # chats 0 and 1 hash to different workers
+    wait_until(lambda: done == [2])
+    release.set()
+    wait_until(lambda: done == [2, 1])
+
+
+def test_overflow_drops_and_notifies_once_per_episode():
+    release = threading.Event()
+    notices = []
+
+    def process(updates):
+        release.wait(5)
+
+    dispatcher = ChatDispatcher(process, workers=1, max_per_chat=3, on_overflow=lambda chat, u: notices.append(chat))
+    dispatcher.submit([message_update(i, 10) for i in range(6)])
+    dispatcher.submit([message_update(6, 10)])
+    assert dispatcher.dropped == 4
+    assert notices == [10]
+
+    release.set()
+    wait_until(lambda: dispatcher.stats()["processed"] == 3)
+    assert dispatcher.stats()["pending"] == 0
+
+    # The chat drained, so its next overflow is reported again
+    release.clear()
+    dispatcher.submit([message_update(i, 10) for i in range(7, 11)])
+    assert notices == [10, 10]
+    release.set()
+    wait_until(lambda: dispatcher.stats()["processed"] == 6)
+
+
+def test_stats_report_queue_wait():
+    dispatcher = ChatDispatcher(lambda updates: time.sleep(0.01), workers=1)
+    assert dispatcher.stats()["wait_p50_ms"] is None
+    dispatcher.submit([message_update(i, 1) for i in range(5)])
+    wait_until(lambda: dispatcher.stats()["processed"] == 5)
+    stats = dispatcher.stats()
+    assert stats["wait_max_ms"] >= 30
+    assert stats["wait_p50_ms"] <= stats["wait_p90_ms"] <= stats["wait_max_ms"]
+
+
+def test_install_advances_polling_offset_before_processing():
+    release = threading.Event()
+    processed = []
+
+    def process(updates):
+        release.wait(5)
+        processed.extend(u.update_id for u in updates)
+
+    bot = SimpleNamespace(last_update_id=0, process_new_updates=None)
+    dispatcher = ChatDispatcher(process, workers=1)
+    dispatcher.install(bot)
+    bot.process_new_updates([message_update(41, 1), message_update(42, 2)])
+    assert bot.last_update_id == 42
+    assert processed == []
+    release.set()
+    wait_until(lambda: processed == [41, 42])
+
+
+def test_held_chat_is_parked_without_blocking_its_worker():
+    order = []
+    resumes = []
+    dispatcher = None
+
+    def process(updates):
+        update = updates[0]
+        order.append(update.update_id)
+        if update.update_id == 1:
+            resumes.append(dispatcher.hold())
+
+    dispatcher = ChatDispatcher(process, workers=1)
+    dispatcher.submit([message_update(1, 5), message_update(2, 5), message_update(3, 6)])
+    wait_until(lambda: order == [1, 3])  # chat 6 shares the only worker and still runs
+    assert dispatcher.stats()["held_chats"] == 1
+
+    threading.Thread(target=resumes[0], args=(lambda: order.append("followup"),)).start()
+    wait_until(lambda: order == [1, 3, "followup", 2])
+    assert dispatcher.stats()["held_chats"] == 0
+
+
+def test_hold_outside_a_worker_returns_none():
+    assert ChatDispatcher(lambda updates: None).hold() is None
+
+
+def test_stuck_worker_shows_in_oldest_pending_age():
+    release = threading.Event()
+    dispatcher = ChatDispatcher(lambda updates: release.wait(5), workers=2)
+    dispatcher.submit([message_update(i, i % 4) for i in range(12)])
+    time.sleep(0.3)
+    stats = dispatcher.stats()
+    assert stats["pending"] == 12
+    assert stats["wait_p90_ms"] is None
+    assert stats["oldest_pending_s"] >= 0.3
+    release.set()
+    wait_until(lambda: dispatcher.stats()["processed"] == 12)
+    assert dispatcher.stats()["oldest_pending_s"] is None
@@ -0,0 +1,82 @@
+# Delta exports: cursor arithmetic across month boundaries and archive folds.
+import os
+from datetime import date
+
+import pytest
+
+from exports import ExportCursors, end_cursor, summary_since
+from storage import PartitionStore
+
+
+def event(ts, sid):
+    return [ts, "BOOKED", sid, f"user{sid}", ts[:10], "Morning", "N/A", "N/A"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PartitionStore(str(tmp_path))
+
+
+def sids(rows):
+    return [row[2] for row in rows]
+
+
+def test_first_export_returns_everything(store):
+    store.append_rows("summary", [event("2026-09-01 10:00:00", 1), event("2026-10-01 10:00:00", 2)])
+    rows, cursor = summary_since(store, None, "t1")
+    assert sids(rows) == [1, 2]
+    assert cursor == {"month": "2026-10", "rows": 1, "at": "t1"}
+
+
+def test_empty_log(store):
+    assert summary_since(store, None, "t")[0] == []
+    assert end_cursor(store, "t") == {"month": None, "rows": 0, "at": "t"}
+
+
+def test_delta_across_month_boundary(store):
+    store.append_rows("summary", [event(f"2026-09-0{i} 10:00:00", i) for i in range(1, 4)])
+    cursor = end_cursor(store, "t0")
+    assert cursor == {"month": "2026-09", "rows": 3, "at": "t0"}
+    assert summary_since(store, cursor, "t0")[0] == []
+
+    store.append_rows("summary", [event("2026-09-20 10:00:00", 4), event("2026-10-02 10:00:00", 5)])
+    store.append_row("summary", event("2026-10-03 10:00:00", 6))
+    rows, cursor = summary_since(store, cursor, "t1")
+    assert sids(rows) == [4, 5, 6]
+    assert cursor == {"month": "2026-10", "rows": 2, "at": "t1"}
+
+
+def test_cursor_survives_archive_fold(store):
+    store.append_rows("summary", [event("2026-10-01 10:00:00", 1), event("2026-10-02 10:00:00", 2)])
+    rows, cursor = summary_since(store, None, "t0")
+    assert sids(rows) == [1, 2]
+
+    store.rotate_archive(date(2026, 11, 1))
+    assert summary_since(store, cursor, "t1")[0] == []
+
+    # A late October event lands in a new hot partition next to the archived month
+    store.append_row("summary", event("2026-10-31 23:00:00", 3))
+    rows, cursor = summary_since(store, cursor, "t2")
+    assert sids(rows) == [3]
+    assert cursor["month"] == "2026-10" and cursor["rows"] == 3
+
+    # Folding it into the archive keeps the order, so the cursor still points past it
+    store.rotate_archive(date(2026, 11, 1))
+    assert not os.path.exists(store.partition_path("summary", "2026-10"))
+    store.append_row("summary", event("2026-11-01 09:00:00", 4))
+    rows, cursor = summary_since(store, cursor, "t3")
+    assert sids(rows) == [4]
+    assert cursor["month"] == "2026-11" and cursor["rows"] == 1
+
+
+def test_cursors_persist_atomically(tmp_path):
+    path = str(tmp_path / "cursors.json")
+    cursors = ExportCursors(path)
+    assert cursors.get(42) is None
+    cursors.set(42, {"month": "2026-10", "rows": 7, "at": "t"})
+    cursors.set(43, {"month": "2026-09", "rows": 1, "at": "t"})
+
+    reloaded = ExportCursors(path)
+    assert reloaded.get(42) == {"month": "2026-10", "rows": 7, "at": "t"}
+    assert reloaded.get("43")["rows"] == 1
+    assert not os.path.exists(path + ".tmp")
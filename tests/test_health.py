@@ -0,0 +1,43 @@
+# Readiness of the update pipeline: last_update follows processed updates, stuck workers fail readiness.
+import threading
+
+import health
+
+
+def dispatch_stats(**overrides):
+    stats = {"workers": 4, "pending": 0, "busiest_chat": 0, "held_chats": 0, "processed": 10, "dropped": 0,
+             "failed": 0, "oldest_pending_s": None, "wait_p50_ms": 1.0, "wait_p90_ms": 2.0, "wait_p99_ms": 3.0,
+             "wait_max_ms": 3.0}
+    stats.update(overrides)
+    return stats
+
+
+def test_last_update_is_marked_after_processing(bot_main, monkeypatch):
+    monkeypatch.setitem(health.activity, "last_update", None)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(updates):
+        started.set()
+        release.wait(5)
+    monkeypatch.setattr(bot_main, "_process_new_updates", slow)
+
+    worker = threading.Thread(target=bot_main.process_updates, args=([object()],))
+    worker.start()
+    assert started.wait(5)
+    assert health.age("last_update") is None
+    release.set()
+    worker.join(5)
+    assert health.age("last_update") < 5
+
+
+def test_update_dispatch_readiness(bot_main, monkeypatch):
+    def check(**overrides):
+        monkeypatch.setattr(bot_main.update_dispatcher, "stats", lambda: dispatch_stats(**overrides))
+        return bot_main.check_update_dispatch()[0]
+
+    assert check()
+    assert check(pending=3, oldest_pending_s=1.0)
+    # A worker stuck on one update: completed waits still look fine
+    assert not check(pending=3, oldest_pending_s=bot_main.HEALTH_MAX_UPDATE_PENDING_S + 1)
+    assert not check(pending=bot_main.HEALTH_MAX_UPDATE_BACKLOG + 1, oldest_pending_s=1.0)
+    assert not check(wait_p90_ms=bot_main.HEALTH_MAX_UPDATE_WAIT_MS + 1)
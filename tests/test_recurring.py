@@ -0,0 +1,54 @@
+# /recurring planning: every occurrence is checked like a single booking, accepted ones count towards the cap.
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from records import Student
+from utils import SG_TZ
+
+# Bookings for February 2030 open on 27 Jan at 18:00
+SG_NOW = SG_TZ.localize(datetime(2030, 1, 27, 19, 0))
+BEN = Student("2400001", "Ben", night_shift=True)
+CAT = Student("2400002", "Cat", special_user=True)
+
+
+@pytest.fixture
+def tenant(bot_main, bot_dir, monkeypatch):
+    monkeypatch.chdir(bot_dir)
+    tenant = bot_main.get_tenant()
+    tenant.index.refresh(SG_NOW.date())
+    return tenant
+
+
+def week(monday, days=5):
+    return [monday + timedelta(days=i) for i in range(days)]
+
+
+def test_accepted_occurrences_count_towards_the_weekly_cap(bot_main, tenant):
+    before = tenant.index.user_bookings(BEN.student_id)
+    accepted, rejected = bot_main.plan_recurring(tenant, BEN.student_id, BEN, "Morning", week(date(2030, 2, 11)), SG_NOW)
+    assert [b.date_str for b in accepted] == ["2030-02-11", "2030-02-12", "2030-02-13", "2030-02-14"]
+    assert rejected == [(date(2030, 2, 15), "weekly cap reached")]
+    assert tenant.index.user_bookings(BEN.student_id) == before  # planning writes nothing
+
+    special = tenant.rules["max_per_week_special"]
+    accepted, rejected = bot_main.plan_recurring(tenant, CAT.student_id, CAT, "Morning", week(date(2030, 2, 11)), SG_NOW)
+    assert len(accepted) == special
+    assert [reason for _, reason in rejected] == ["weekly cap reached"] * (5 - special)
+
+
+def test_occurrences_are_rejected_with_a_reason(bot_main, tenant):
+    tenant.store.append_row("bookings", ["2030-01-27 19:00:00", BEN.student_id, BEN.name, "2030-02-04", "Morning"])
+    tenant.index.refresh(SG_NOW.date())
+
+    dates = bot_main.recurring_dates(0, 6, date(2030, 2, 4))  # Mondays 4 Feb .. 11 Mar
+    accepted, rejected = bot_main.plan_recurring(tenant, BEN.student_id, BEN, "Morning", dates, SG_NOW)
+    assert [b.date_str for b in accepted] == ["2030-02-11", "2030-02-18", "2030-02-25"]
+    assert rejected == [(date(2030, 2, 4), "already booked"),
+                        (date(2030, 3, 4), "booking not open yet"),
+                        (date(2030, 3, 11), "booking not open yet")]
+
+    night = next(day for day in week(date(2030, 2, 11), 7) if day.weekday() in tenant.night_weekdays)
+    accepted, rejected = bot_main.plan_recurring(tenant, CAT.student_id, CAT, "Night", [night], SG_NOW)
+    assert accepted == []
+    assert rejected == [(night, "not available to you")]
@@ -0,0 +1,65 @@
+# Booking-window schedule, rush windows and the FIFO admission queue.
+import threading
+from datetime import date, datetime, timedelta
+
+from rush import AdmissionQueue, RushMode, opening_time, window_open
+from utils import SG_TZ
+
+
+def sg(*args):
+    return SG_TZ.localize(datetime(*args))
+
+
+def last_open_day(now, days_before=5, hour=18):
+    day = now.date()
+    while window_open(day + timedelta(days=1), now, days_before, hour):
+        day += timedelta(days=1)
+    return day
+
+
+def test_next_month_opens_days_before_at_hour():
+    assert opening_time(date(2026, 11, 1)) == sg(2026, 10, 27, 18, 0)
+    assert last_open_day(sg(2026, 10, 26, 17, 0)) == date(2026, 10, 31)
+    assert last_open_day(sg(2026, 10, 27, 17, 59)) == date(2026, 10, 31)
+    assert last_open_day(sg(2026, 10, 27, 18, 0)) == date(2026, 11, 30)
+    assert last_open_day(sg(2026, 11, 1, 0, 1)) == date(2026, 11, 30)
+
+
+def test_window_opens_inside_the_rush_window():
+    rush = RushMode(lambda month: None, lead=timedelta(minutes=10), duration=timedelta(minutes=30))
+    before, opened, after = sg(2026, 10, 27, 17, 55), sg(2026, 10, 27, 18, 5), sg(2026, 10, 27, 18, 45)
+    assert rush.current_window(before) == (date(2026, 11, 1), sg(2026, 10, 27, 18, 0))
+    assert rush.current_window(opened) is not None
+    assert rush.current_window(after) is None
+    assert not window_open(date(2026, 11, 15), before)
+    assert window_open(date(2026, 11, 15), opened)
+
+
+def test_booking_window_open_follows_tenant_rules(bot_main):
+    tenant = bot_main.get_tenant()
+    days_before, hour = tenant.rules["opening_days_before"], tenant.rules["opening_hour"]
+    opens = opening_time(date(2027, 2, 1), days_before, hour)
+    assert tenant.rush.current_window(opens - timedelta(minutes=1)) is not None
+    assert not bot_main.booking_window_open(tenant, date(2027, 2, 3), opens - timedelta(minutes=1))
+    assert bot_main.booking_window_open(tenant, date(2027, 2, 3), opens)
+    assert not bot_main.booking_window_open(tenant, date(2027, 3, 3), opens)
+
+
+def test_admission_queue_gives_each_user_one_place_in_order():
+    queue, gate, ran, done = AdmissionQueue(), threading.Event(), [], threading.Event()
+    assert queue.submit("a", gate.wait) == (1, True)
+    assert queue.submit("b", lambda: ran.append("b")) == (2, True)
+    assert queue.submit("c", lambda: ran.append("c")) == (3, True)
+    assert queue.submit("b", lambda: ran.append("b again")) == (2, False)
+    assert queue.submit("d", done.set) == (4, True)
+    gate.set()
+    assert done.wait(5)
+    assert ran == ["b", "c"]
+
+
+def test_admission_queue_keeps_going_after_a_failed_job():
+    queue, done = AdmissionQueue(), threading.Event()
+    queue.submit("a", lambda: 1 / 0)
+    queue.submit("b", done.set)
+    assert done.wait(5)
+    assert queue.submit("a", lambda: None)[1]
@@ -0,0 +1,81 @@
+# Sessions keep only the student id and tenant; names and flags come from the students file on use.
+import os
+import shutil
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from openpyxl import Workbook
+
+from conftest import STUDENTS
+
+
+def message(user_id, text=""):
+    return SimpleNamespace(chat=SimpleNamespace(id=user_id), from_user=SimpleNamespace(id=user_id), text=text)
+
+
+@pytest.fixture
+def main(bot_main, bot_dir, monkeypatch):
+    """bot_main run from its data directory, with outgoing bot calls recorded in main.sent."""
+    monkeypatch.chdir(bot_dir)
+    sent = []
+    monkeypatch.setattr(bot_main.bot, "send_message", lambda chat_id, text, **kw: sent.append((chat_id, text)))
+    monkeypatch.setattr(bot_main, "send_manual", lambda *args: None)
+    monkeypatch.setattr(bot_main, "sent", sent, raising=False)
+
+    backup = os.path.join(bot_dir, "students.bak")
+    shutil.copy("students.xlsx", backup)
+    yield bot_main
+    shutil.move(backup, "students.xlsx")
+    touch_students()  # the next test reloads the original file
+
+
+def touch_students():
+    """Give students.xlsx a new mtime so the tenant's cached copy is reloaded."""
+    stamp = os.path.getmtime("students.xlsx") + 10
+    os.utime("students.xlsx", (stamp, stamp))
+
+
+def write_students(rows):
+    wb = Workbook()
+    wb.active.append(["StudentID", "Name", "NightShift", "IsAdmin", "SpecialUser"])
+    for row in rows:
+        wb.active.append(list(row))
+    wb.save("students.xlsx")
+    touch_students()
+
+
+def login(main, user_id, sid, name):
+    main.get_student_name(message(user_id, name), sid)
+    assert main.sent[-1] == (user_id, f"Login success, {name}!")
+
+
+def test_session_keeps_only_id_and_tenant(main):
+    login(main, 501, "2400001", "Ben")
+    assert main.logged_in_users.get(501) == {"student_id": "2400001", "tenant": main.DEFAULT_TENANT}
+
+
+def test_flags_are_read_again_on_use(main):
+    login(main, 502, "2400001", "Ben")
+    assert main.get_admin_user(message(502)) is None
+
+    write_students([(2400001, "Ben", 1, 1, 0)])
+    tenant, student = main.get_admin_user(message(502))
+    assert (tenant.key, student.student_id) == (main.DEFAULT_TENANT, "2400001")
+
+    write_students([(2400001, "Ben", 1, 0, 0)])
+    assert main.get_admin_user(message(502)) is None
+
+
+def test_removed_student_is_asked_to_log_in_again(main):
+    login(main, 503, "2400003", "Dan")
+    write_students([row for row in STUDENTS if row[0] != 2400003])
+    tenant = main.get_tenant()
+
+    main.reserve_handler(message(503, "/reserve"))
+    assert main.sent[-1] == (503, main.LOGIN_AGAIN)
+
+    main.book_recurring(message(503, "/recurring Morning Mon 2"), tenant, "2400003", "Morning", 0, 2)
+    assert main.sent[-1] == (503, main.LOGIN_AGAIN)
+
+    assert "Night" not in main.get_available_shifts(tenant, "2400003", date(2030, 1, 7))
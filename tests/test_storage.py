@@ -0,0 +1,68 @@
+# Partition writes: validated partition dates and atomic saves under concurrent readers.
+import logging
+import os
+import threading
+from datetime import date
+
+import pytest
+from openpyxl import Workbook
+
+from storage import PartitionStore
+
+
+def booking(day, sid=1):
+    return ["2026-10-01 09:00:00", sid, "Ann", day, "Morning"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PartitionStore(str(tmp_path))
+
+
+@pytest.mark.parametrize("bad", [None, "", "19/10/2026", "soon"])
+def test_append_rejects_rows_without_a_date(store, bad):
+    with pytest.raises(ValueError, match="is not a YYYY-MM-DD date"):
+        store.append_rows("bookings", [booking("2026-10-20"), booking(bad)])
+    assert store.list_months("bookings") == []  # nothing written
+
+
+def test_migrate_skips_rows_without_a_date(store, tmp_path, caplog):
+    wb = Workbook()
+    for row in (["timeStamp", "studentID", "name", "date", "shift"],
+                booking("2026-09-01", 1), booking(None, 2), booking("19/10/2026", 3), booking(date(2026, 10, 2), 4)):
+        wb.active.append(row)
+    legacy = str(tmp_path / "bookings.xlsx")
+    wb.save(legacy)
+
+    with caplog.at_level(logging.WARNING):
+        assert store.migrate_legacy("bookings", legacy) == 2
+    assert "skipped 2 rows" in caplog.text
+    assert store.list_months("bookings") == ["2026-09", "2026-10"]
+
+
+def test_readers_never_see_a_partial_partition(store):
+    store.append_row("bookings", booking("2026-10-20"))
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                list(store.read_rows("bookings", start=date(2026, 10, 1)))
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for t in readers:
+        t.start()
+    try:
+        for i in range(60):
+            store.append_row("bookings", booking("2026-10-20", i))
+        assert store.delete_first("bookings", date(2026, 10, 20), lambda r: r["student_id"] == 5)
+    finally:
+        stop.set()
+        for t in readers:
+            t.join()
+    assert errors == []
+    assert len(list(store.read_rows("bookings"))) == 60
+    assert not any(name.endswith(".tmp") for name in os.listdir(store.partition_dir))
@@ -0,0 +1,59 @@
+# Weekly cap: bookings Monday to Sunday count, near-term dates are exempt.
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from records import Booking, Shift, Student
+from utils import SG_TZ
+
+SG_NOW = SG_TZ.localize(datetime(2030, 1, 28, 12, 0))  # Monday
+REGULAR = Student("2400001", "Ben")
+SPECIAL = Student("2400002", "Cat", special_user=True)
+
+
+@pytest.fixture
+def cap(bot_main):
+    tenant = bot_main.get_tenant()
+
+    def check(student, bookings, day, now=SG_NOW):
+        booked = [Booking(d.toordinal(), Shift.parse("Morning"), student.student_id) for d in bookings]
+        return bot_main.check_weekly_cap(tenant, student, booked, day, now)
+    check.rules = tenant.rules
+    return check
+
+
+def days(monday, n):
+    return [monday + timedelta(days=i) for i in range(n)]
+
+
+def test_regular_cap_counts_only_the_same_week(cap):
+    limit = cap.rules["max_per_week"]
+    monday = date(2030, 2, 11)
+    assert cap(REGULAR, days(monday, limit - 1), monday + timedelta(days=6)) is None
+    refusal = cap(REGULAR, days(monday, limit), monday + timedelta(days=6))
+    assert refusal.startswith(f"Max {limit} shifts/week")
+    # The Sunday before and the Monday after belong to other weeks
+    assert cap(REGULAR, days(monday, limit), monday - timedelta(days=1)) is None
+    assert cap(REGULAR, days(monday, limit), monday + timedelta(days=7)) is None
+
+
+def test_regular_cap_does_not_apply_within_exempt_days(cap):
+    limit, exempt = cap.rules["max_per_week"], cap.rules["cap_exempt_days"]
+    monday = SG_NOW.date()
+    full = days(monday, limit)
+    assert cap(REGULAR, full, monday + timedelta(days=exempt - 1)) is None
+    assert cap(REGULAR, full, monday + timedelta(days=exempt)) is not None
+
+
+def test_special_cap_uses_its_own_limit_and_exempt_hours(cap):
+    limit, hours = cap.rules["max_per_week_special"], cap.rules["cap_exempt_hours_special"]
+    monday = date(2030, 2, 11)
+    full = days(monday, limit)
+    assert cap(SPECIAL, days(monday, limit - 1), monday + timedelta(days=6)) is None
+    assert cap(SPECIAL, full, monday + timedelta(days=6)).startswith(f"Max {limit} shifts/week for your account")
+
+    # Within the exempt hours of the shift date's midnight the cap is lifted
+    day = monday + timedelta(days=6)
+    midnight = SG_TZ.localize(datetime.combine(day, datetime.min.time()))
+    assert cap(SPECIAL, full, day, midnight - timedelta(hours=hours - 1)) is None
+    assert cap(SPECIAL, full, day, midnight - timedelta(hours=hours + 1)) is not None
@@ -0,0 +1,52 @@
+# Header-mapped reads: column lookup by name, legacy aliases, optional columns and projection.
+import pytest
+from openpyxl import Workbook
+
+from storage import SCHEMAS, STUDENTS_SCHEMA
+from workbook import SchemaError, normalize, read_table
+
+
+def write(path, rows):
+    wb = Workbook()
+    for row in rows:
+        wb.active.append(row)
+    wb.save(path)
+    return str(path)
+
+
+def test_normalize_ignores_case_spaces_and_punctuation():
+    assert normalize("LIC Verified") == normalize("lic_verified") == "licverified"
+    assert normalize(" StudentID ") == normalize("studentId")
+
+
+def test_resolve_finds_reordered_and_legacy_headers():
+    header = ["Shift", "LIC vertified", "name", "timeStamp", "Date", "studentID", "Action"]
+    columns = SCHEMAS["summary"].resolve(header)
+    assert columns == {"timestamp": 3, "action": 6, "student_id": 5, "name": 2, "date": 4, "shift": 0,
+                       "lic": None, "lic_verified": 1}
+
+
+def test_resolve_reports_missing_required_columns():
+    with pytest.raises(SchemaError, match="bookings.xlsx: bookings table is missing column\\(s\\) Date, Shift"):
+        SCHEMAS["bookings"].resolve(["Timestamp", "StudentID", "Name"], "bookings.xlsx")
+    with pytest.raises(SchemaError):
+        SCHEMAS["bookings"].resolve(None)
+
+
+def test_read_table_projects_fields_and_skips_blank_rows(tmp_path):
+    path = write(tmp_path / "students.xlsx", [
+        ["timeStamp", "studentID", "name", "contact", "isAdmin"],
+        [None, 2400000, "Ann", 9123, 1],
+        [None, None, None, None, None],
+        [None, 2400001, "Ben"],
+    ])
+    rows = list(read_table(path, STUDENTS_SCHEMA, ("student_id", "name", "is_admin", "is_lic")))
+    assert rows == [(2400000, "Ann", 1, None), (2400001, "Ben", None, None)]
+
+
+def test_read_table_defaults_to_all_schema_fields(tmp_path):
+    path = write(tmp_path / "bookings.xlsx", [
+        ["Date", "Shift", "StudentID", "Name", "Timestamp"],
+        ["2026-10-20", "Morning", 2400000, "Ann", "2026-10-01 09:00:00"],
+    ])
+    assert list(read_table(path, SCHEMAS["bookings"])) == [("2026-10-01 09:00:00", 2400000, "Ann", "2026-10-20", "Morning")]
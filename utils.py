@@ -0,0 +1,23 @@
+# utils.py
+# Shared helpers that do not depend on the bot instance.
+import pytz
+
+# All booking dates and times are Singapore time
+SG_TZ = pytz.timezone("Asia/Singapore")
+
+# === Shift defaults ===
+# Start/end times per shift. Tenants may run a subset of these with their own times (see tenants.py).
+SHIFT_OPTIONS = {
+    "Morning": ("09:00", "12:00"),
+    "Afternoon": ("14:00", "18:00"),
+    "Night": ("18:00", "22:00"),
+}
+
+# Default slots per shift per day, and the weekdays (Wed/Thu) with a night shift.
+# Tenants override both; Tenant.shift_capacity() applies them.
+SHIFT_CAPACITY = {
+    "Morning": 1,
+    "Afternoon": 2,
+    "Night": 2,
+}
+NIGHT_SHIFT_WEEKDAYS = (2, 3)
@@ -0,0 +1,69 @@
+# workbook.py
+# Header-mapped, column-projected reads of xlsx tables.
+# Columns are found by header name once per file open, so readers never depend on column order.
+from openpyxl import load_workbook
+
+
+class SchemaError(ValueError):
+    """A workbook is missing a required column."""
+
+
+def normalize(header):
+    """Header cell -> matching key: case, spaces and punctuation are ignored ("LIC Verified" == "lic_verified")."""
+    return "".join(ch for ch in str(header).lower() if ch.isalnum())
+
+
+class Schema:
+    """
+    Logical fields of a table, each with the header names it may appear under.
+    Fields listed in optional may be absent from a file; they then read as None.
+    """
+
+    def __init__(self, name, fields, optional=()):
+        self.name = name
+        self.fields = {field: (names,) if isinstance(names, str) else tuple(names) for field, names in fields.items()}
+        self.optional = frozenset(optional)
+
+    @property
+    def headers(self):
+        """Canonical header row, used when writing a new file."""
+        return [names[0] for names in self.fields.values()]
+
+    def resolve(self, header, source="workbook"):
+        """Field -> 0-based column index (or None) for a header row; raises SchemaError on missing columns."""
+        positions = {}
+        for i, cell in enumerate(header or ()):
+            if cell is not None:
+                positions.setdefault(normalize(cell), i)
+
+        columns = {}
+        missing = []
+        for field, names in self.fields.items():
+            index = next((positions[normalize(n)] for n in names if normalize(n) in positions), None)
+            if index is None and field not in self.optional:
+                missing.append(names[0])
+            columns[field] = index
+        if missing:
+            raise SchemaError(f"{source}: {self.name} table is missing column(s) {', '.join(missing)}")
+        return columns
+
+
+def read_table(path, schema, fields=None):
+    """
+    Yield a tuple of the requested fields (all schema fields by default) for every non-empty data row.
+    The header is validated once; cells to the right of the last needed column are never read.
+    """
+    fields = tuple(fields or schema.fields)
+    wb = load_workbook(path, read_only=True)
+    try:
+        ws = wb.active
+        header = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
+        columns = schema.resolve(header, path)
+        positions = [columns[f] for f in fields]
+        width = max((p for p in positions if p is not None), default=-1) + 1
+        for row in ws.iter_rows(min_row=2, max_col=width, values_only=True):
+            if not row or all(v is None for v in row):
+                continue
+            yield tuple(row[p] if p is not None and p < len(row) else None for p in positions)
+    finally:
+        wb.close()